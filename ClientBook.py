@@ -0,0 +1,155 @@
+import json
+import os
+
+import numpy as np
+
+from ResultCache import model_fingerprint
+from StreamScoring import INPUT_COLUMNS, recommendation_codes
+
+BOOK_FORMAT = 'client-book'
+BOOK_FORMAT_VERSION = 1
+HEADER_FILE = 'header.json'
+
+
+class ClientBook:
+    """
+    Client book stored as a directory of memory-mapped columns: one .npy per
+    column plus header.json, which records the format version, row count,
+    column files and dtypes, and the model_version (fingerprint) of the model
+    that wrote the score columns. Opening a book only maps the files, so it
+    takes the same time whatever the row count.
+    """
+
+    def __init__(self, path, header, mode):
+        self.path = os.fspath(path)
+        self.header = header
+        self.mode = mode
+        self.columns = {name: np.load(os.path.join(self.path, column['file']), mmap_mode=mode)
+                        for name, column in header['columns'].items()}
+
+    @property
+    def rows(self):
+        return self.header['rows']
+
+    @property
+    def model_version(self):
+        return self.header['model_version']
+
+    @property
+    def inputs(self):
+        """The five model input columns, in compute_portfolio_adjustment order"""
+        return [self.columns[name] for name in INPUT_COLUMNS]
+
+    @classmethod
+    def create(cls, path, rows):
+        """New book with zero-filled input columns, opened for writing"""
+        os.makedirs(path, exist_ok=False)
+        header = {'format': BOOK_FORMAT, 'format_version': BOOK_FORMAT_VERSION, 'rows': int(rows),
+                  'model_version': None, 'columns': {}}
+        for name in INPUT_COLUMNS:
+            cls._new_column_file(path, header, name, np.float64)
+        cls._write_header(path, header)
+        return cls(path, header, 'r+')
+
+    @classmethod
+    def from_arrays(cls, path, *inputs):
+        """Write five equal-length input arrays as a new book"""
+        book = cls.create(path, len(inputs[0]))
+        for column, values in zip(book.inputs, inputs):
+            column[:] = values
+            column.flush()
+        return book
+
+    @classmethod
+    def open(cls, path, mode='r'):
+        """Map an existing book; mode='r+' allows adding or rewriting columns"""
+        with open(os.path.join(path, HEADER_FILE)) as handle:
+            header = json.load(handle)
+        if header.get('format') != BOOK_FORMAT:
+            raise ValueError(f"{path} is not a client book")
+        if header['format_version'] > BOOK_FORMAT_VERSION:
+            raise ValueError(f"Client book format {header['format_version']} is newer than "
+                             f"supported version {BOOK_FORMAT_VERSION}")
+        return cls(path, header, mode)
+
+    @staticmethod
+    def _new_column_file(path, header, name, dtype):
+        file_name = f"{name}.npy"
+        column = np.lib.format.open_memmap(os.path.join(path, file_name), mode='w+',
+                                           dtype=dtype, shape=(header['rows'],))
+        header['columns'][name] = {'file': file_name, 'dtype': np.dtype(dtype).str}
+        return column
+
+    @staticmethod
+    def _write_header(path, header):
+        # Replace atomically so readers never see a half-written header
+        temporary = os.path.join(path, HEADER_FILE + '.tmp')
+        with open(temporary, 'w') as handle:
+            json.dump(header, handle, indent=2)
+        os.replace(temporary, os.path.join(path, HEADER_FILE))
+
+    def column(self, name, dtype=np.float64):
+        """Existing column, or a new zero-filled one recorded in the header"""
+        if name in self.columns:
+            return self.columns[name]
+        if self.mode == 'r':
+            raise ValueError("Open the book with mode='r+' to add columns")
+        self.columns[name] = self._new_column_file(self.path, self.header, name, dtype)
+        self._write_header(self.path, self.header)
+        return self.columns[name]
+
+    def score(self, scorer, chunk_size=262144, model_version=None):
+        """
+        Score the book with scorer.compute_portfolio_adjustment_batch (a model
+        or a ShardedScorer), writing the 'score' and 'recommendation_code'
+        columns chunk by chunk. Inputs are passed as slices of the mapped
+        columns, so nothing is copied on the way in. model_version defaults to
+        the fingerprint of a model scorer or the model_version of a snapshot or
+        ShardedScorer; ValueError when none can be determined. A RegisteredModel
+        is pinned first, so every chunk and the recorded version agree.
+        """
+        if hasattr(scorer, 'pin'):
+            scorer = scorer.pin()
+        if model_version is None and hasattr(scorer, 'control_system'):
+            model_version = model_fingerprint(scorer)
+        elif model_version is None:
+            model_version = getattr(scorer, 'model_version', None)
+        if model_version is None:
+            raise ValueError(f"Cannot tell which model version {type(scorer).__name__} scores with; "
+                             f"pass model_version")
+        scores = self.column('score', np.float64)
+        codes = self.column('recommendation_code', np.int8)
+        inputs = self.inputs
+        for start in range(0, self.rows, chunk_size):
+            stop = min(start + chunk_size, self.rows)
+            scores[start:stop] = scorer.compute_portfolio_adjustment_batch(*[values[start:stop] for values in inputs])
+            codes[start:stop] = recommendation_codes(scores[start:stop])
+        scores.flush()
+        codes.flush()
+        self.header['model_version'] = model_version
+        self._write_header(self.path, self.header)
+        return scores
+
+
+def main():
+    import time
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+    from ShardedScoring import synthetic_book
+
+    path = input("Directory for the new client book: ")
+    rows = int(input("Synthetic clients to write (e.g. 1000000): "))
+    book = ClientBook.from_arrays(path, *synthetic_book(rows))
+
+    start = time.perf_counter()
+    book.score(PortfolioAdjustmentFuzzySystem())
+    print(f"Scored {rows} clients in {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    book = ClientBook.open(path)
+    print(f"Re-opened the book in {1000 * (time.perf_counter() - start):.2f} ms, "
+          f"columns {list(book.columns)}, model version {book.model_version[:12]}")
+
+
+if __name__ == "__main__":
+    main()
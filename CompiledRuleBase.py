@@ -0,0 +1,437 @@
+import numpy as np
+import Headless  # noqa: F401 - keeps skfuzzy.control from importing matplotlib.pyplot
+
+# Maximum absolute difference between the compiled engine and the skfuzzy
+# simulator it was compiled from (observed differences are floating point noise)
+BATCH_TOLERANCE = 1e-9
+
+# Two-point Gauss-Legendre nodes on [0, 1]; they integrate x * f(x) exactly
+# when f is linear, and never land on a segment end where f may jump
+_GAUSS_NODES = np.array([0.5 - 0.5 / np.sqrt(3), 0.5 + 0.5 / np.sqrt(3)])
+
+
+def _segment_moments(x1, x2, y1, y2):
+    """Exact area and first moment of linear segments from (x1, y1) to (x2, y2)"""
+    width = x2 - x1
+    area = 0.5 * width * (y1 + y2)
+    moment = width * width * (y1 + 2 * y2) / 6 + x1 * area
+    return area, moment
+
+
+class CompiledRuleBase:
+    """
+    Dense array form of a list of skfuzzy Mamdani rules.
+
+    Every antecedent is rewritten as an AND of OR-clauses and stored as one
+    (rules x clauses x width) array of membership column indices. Unused slots
+    point at a constant column (0 inside an OR, 1 for a missing clause), so a
+    whole rule base is evaluated with a single gather, a max over the clause
+    width and a min over the clauses.
+    """
+
+    def __init__(self, antecedents, consequent, rules, output_shapes=None):
+        """
+        output_shapes: optional {term label: trimf/trapmf parameters} of the
+        consequent terms, required for analytic_centroid()
+        """
+        self.input_labels = [antecedent.label for antecedent in antecedents]
+        self.universes = [np.asarray(antecedent.universe, dtype=float) for antecedent in antecedents]
+        self.grid_positions = [np.arange(len(universe), dtype=float) for universe in self.universes]
+
+        # All antecedent term mfs flattened into one array, so every term of
+        # every variable is interpolated with a single gather
+        term_mfs = [(index, np.asarray(term.mf, dtype=float))
+                    for index, antecedent in enumerate(antecedents) for term in antecedent.terms.values()]
+        self.term_variables = np.array([index for index, _ in term_mfs], dtype=np.intp)
+        self.term_offsets = np.cumsum([0] + [len(mf) for _, mf in term_mfs[:-1]]).astype(np.intp)
+        self.term_last_segments = np.array([len(mf) - 2 for _, mf in term_mfs], dtype=np.intp)
+        self.flat_term_mfs = np.concatenate([mf for _, mf in term_mfs])
+
+        # Membership columns: antecedent terms in input order, then complements
+        # of negated terms, then the constant 0 and 1 columns used as padding
+        self.term_columns = {}
+        for antecedent in antecedents:
+            for term in antecedent.terms.values():
+                self.term_columns[(antecedent.label, term.label)] = len(self.term_columns)
+        self.negated_columns = []
+
+        self.output_label = consequent.label
+        self.output_terms = list(consequent.terms)
+        self.output_universe = np.asarray(consequent.universe, dtype=float)
+        self.output_term_mfs = np.array([term.mf for term in consequent.terms.values()], dtype=float)
+        self.output_grid_positions = np.arange(len(self.output_universe), dtype=float)
+        self.output_shapes = None
+        if output_shapes is not None:
+            self._compile_output_shapes(output_shapes)
+
+        # One compiled row per (rule, consequent term) pair
+        clauses = []
+        consequent_terms = []
+        weights = []
+        for rule in rules:
+            if rule.and_func is not np.fmin or rule.or_func is not np.fmax:
+                raise ValueError("Only rules using np.fmin/np.fmax can be compiled")
+            rule_clauses = self._to_clauses(rule.antecedent, False)
+            for weighted_term in rule.consequent:
+                if weighted_term.term.parent.label != self.output_label:
+                    raise ValueError(f"Rule consequent {weighted_term.term.parent.label!r} "
+                                     f"is not {self.output_label!r}")
+                clauses.append(rule_clauses)
+                consequent_terms.append(self.output_terms.index(weighted_term.term.label))
+                weights.append(weighted_term.weight)
+
+        self.zero_column = len(self.term_columns) + len(self.negated_columns)
+        self.one_column = self.zero_column + 1
+        self.n_columns = self.one_column + 1
+
+        max_clauses = max(len(rule_clauses) for rule_clauses in clauses)
+        max_width = max(len(clause) for rule_clauses in clauses for clause in rule_clauses)
+        self.rule_terms = np.full((len(clauses), max_clauses, max_width), self.zero_column, dtype=np.intp)
+        for row, rule_clauses in enumerate(clauses):
+            self.rule_terms[row, len(rule_clauses):, :] = self.one_column
+            for index, clause in enumerate(rule_clauses):
+                self.rule_terms[row, index, :len(clause)] = clause
+
+        self.consequent_terms = np.array(consequent_terms, dtype=np.intp)
+        self.rule_weights = np.array(weights, dtype=float)
+        self.consequent_matrix = np.zeros((len(clauses), len(self.output_terms)))
+        self.consequent_matrix[np.arange(len(clauses)), self.consequent_terms] = 1.0
+
+    def _compile_output_shapes(self, output_shapes):
+        # Triangles are trapezoids with a single-point top
+        shapes = []
+        for label in self.output_terms:
+            params = [float(value) for value in output_shapes[label]]
+            if len(params) == 3:
+                params = [params[0], params[1], params[1], params[2]]
+            if len(params) != 4 or params != sorted(params):
+                raise ValueError(f"Term {label!r} needs sorted trimf or trapmf parameters")
+            shapes.append(params)
+        self.output_shapes = np.array(shapes)
+
+        a, b, c, d = self.output_shapes.T
+        self.rise_vertical = b == a
+        self.fall_vertical = d == c
+        self.rise_slope = np.divide(1.0, b - a, out=np.zeros_like(a), where=~self.rise_vertical)
+        self.fall_slope = np.divide(1.0, d - c, out=np.zeros_like(d), where=~self.fall_vertical)
+
+        # Breakpoints that do not depend on the cut levels: universe bounds,
+        # term vertices and intersections between edges of different terms
+        lower, upper = self.output_universe[0], self.output_universe[-1]
+        edges = [(1.0 / (b[t] - a[t]), a[t]) for t in range(len(a)) if b[t] > a[t]]
+        edges += [(-1.0 / (d[t] - c[t]), d[t]) for t in range(len(d)) if d[t] > c[t]]
+        crossings = []
+        for index, (slope, root) in enumerate(edges):
+            for other_slope, other_root in edges[index + 1:]:
+                if slope != other_slope:
+                    # slope * (x - root) == other_slope * (x - other_root)
+                    crossings.append((slope * root - other_slope * other_root) / (slope - other_slope))
+        points = np.concatenate([[lower, upper], self.output_shapes.ravel(), crossings])
+        self.fixed_breakpoints = np.unique(np.clip(points, lower, upper))
+
+    def _to_clauses(self, antecedent, negate):
+        """Rewrite an antecedent tree as a list of OR-clauses that are AND-ed together"""
+        # Only compiling needs skfuzzy; engines restored with from_state() never import it
+        from skfuzzy.control.term import Term, TermAggregate
+
+        if isinstance(antecedent, Term):
+            column = self.term_columns[(antecedent.parent.label, antecedent.label)]
+            if negate:
+                if column not in self.negated_columns:
+                    self.negated_columns.append(column)
+                column = len(self.term_columns) + self.negated_columns.index(column)
+            return [[column]]
+        if not isinstance(antecedent, TermAggregate):
+            raise ValueError(f"Unsupported rule antecedent: {antecedent!r}")
+
+        if antecedent.kind == 'not':
+            return self._to_clauses(antecedent.term1, not negate)
+        first = self._to_clauses(antecedent.term1, negate)
+        second = self._to_clauses(antecedent.term2, negate)
+        # De Morgan: a negated OR is an AND of the negated terms and vice versa
+        if (antecedent.kind == 'and') != negate:
+            return first + second
+        return [left + right for left in first for right in second]
+
+    # Arrays that, with the metadata from state(), fully describe a compiled rule base
+    _STATE_ARRAYS = ('term_variables', 'term_offsets', 'term_last_segments', 'flat_term_mfs',
+                     'output_universe', 'output_term_mfs', 'rule_terms', 'consequent_terms',
+                     'rule_weights', 'consequent_matrix')
+    _SHAPE_ARRAYS = ('output_shapes', 'rise_vertical', 'fall_vertical', 'rise_slope', 'fall_slope',
+                     'fixed_breakpoints')
+
+    def state(self):
+        """
+        (arrays, metadata) with everything the engine computes from, so
+        from_state() can rebuild it without the skfuzzy variables and rules.
+        metadata holds only JSON-friendly values.
+        """
+        arrays = {name: getattr(self, name) for name in self._STATE_ARRAYS}
+        arrays.update({f'universe_{index}': universe for index, universe in enumerate(self.universes)})
+        if self.output_shapes is not None:
+            arrays.update({name: getattr(self, name) for name in self._SHAPE_ARRAYS})
+        metadata = {
+            'input_labels': self.input_labels,
+            'term_columns': [[variable, term, column] for (variable, term), column in self.term_columns.items()],
+            'negated_columns': [int(column) for column in self.negated_columns],
+            'output_label': self.output_label,
+            'output_terms': self.output_terms,
+            'zero_column': int(self.zero_column),
+            'one_column': int(self.one_column),
+            'n_columns': int(self.n_columns)
+        }
+        return arrays, metadata
+
+    @classmethod
+    def from_state(cls, arrays, metadata):
+        """Rule base restored from state() output, skipping compilation"""
+        rule_base = cls.__new__(cls)
+        for name in cls._STATE_ARRAYS:
+            setattr(rule_base, name, np.asarray(arrays[name]))
+        rule_base.input_labels = list(metadata['input_labels'])
+        rule_base.universes = [np.asarray(arrays[f'universe_{index}'], dtype=float)
+                               for index in range(len(rule_base.input_labels))]
+        rule_base.grid_positions = [np.arange(len(universe), dtype=float) for universe in rule_base.universes]
+        rule_base.term_columns = {(variable, term): column for variable, term, column in metadata['term_columns']}
+        rule_base.negated_columns = list(metadata['negated_columns'])
+        rule_base.output_label = metadata['output_label']
+        rule_base.output_terms = list(metadata['output_terms'])
+        rule_base.output_grid_positions = np.arange(len(rule_base.output_universe), dtype=float)
+        rule_base.zero_column = metadata['zero_column']
+        rule_base.one_column = metadata['one_column']
+        rule_base.n_columns = metadata['n_columns']
+        rule_base.output_shapes = None
+        if 'output_shapes' in arrays:
+            for name in cls._SHAPE_ARRAYS:
+                setattr(rule_base, name, np.asarray(arrays[name]))
+        return rule_base
+
+    def fuzzify(self, inputs):
+        """
+        Membership matrix (rows x columns) for a list of input arrays. Rows
+        with a NaN input are all NaN, so they score NaN like rows where no
+        rule fires.
+        """
+        size = len(inputs[0])
+        memberships = np.empty((size, self.n_columns))
+
+        # Same linear interpolation on the sampled universe as skfuzzy: find the
+        # fractional grid position once per variable, then gather all terms
+        positions = np.column_stack([np.interp(values, universe, grid) for universe, grid, values
+                                     in zip(self.universes, self.grid_positions, inputs)])
+        missing = np.isnan(positions)
+        if missing.any():
+            # Any in-range position keeps the gather valid; these rows are overwritten below
+            positions[missing] = 0.0
+        positions = positions[:, self.term_variables]
+        index = np.minimum(positions.astype(np.intp), self.term_last_segments)
+        fraction = positions - index
+        index += self.term_offsets
+        left, right = self.flat_term_mfs[index], self.flat_term_mfs[index + 1]
+        column = len(self.term_variables)
+        memberships[:, :column] = left + (right - left) * fraction
+
+        for offset, negated in enumerate(self.negated_columns):
+            memberships[:, column + offset] = 1.0 - memberships[:, negated]
+        memberships[:, self.zero_column] = 0.0
+        memberships[:, self.one_column] = 1.0
+        if missing.any():
+            memberships[missing.any(axis=1)] = np.nan
+        return memberships
+
+    def rule_strengths(self, memberships):
+        """Firing strength (rows x rules) of every compiled rule"""
+        return memberships[:, self.rule_terms].max(axis=3).min(axis=2) * self.rule_weights
+
+    def activations(self, strengths):
+        """Cut level (rows x output terms) of every consequent term"""
+        return (strengths[:, :, None] * self.consequent_matrix[None, :, :]).max(axis=1)
+
+    def centroid(self, activations):
+        """
+        Centroid of the clipped and max-aggregated output terms.
+
+        Like skfuzzy, the sampled output universe is upsampled at the points
+        where each term crosses its cut level. Rows with an empty output are NaN.
+        """
+        universe = self.output_universe
+        term_mfs = self.output_term_mfs
+
+        # Clip and aggregate the consequent terms on the sampled universe
+        output_mf = np.minimum(activations[:, :, None], term_mfs[None, :, :]).max(axis=1)
+        area, moment = _segment_moments(universe[:-1], universe[1:], output_mf[:, :-1], output_mf[:, 1:])
+
+        # Recompute the segments that contain a cut point exactly
+        left, right = term_mfs[:, :-1], term_mfs[:, 1:]
+        cuts = activations[:, :, None]
+        crossing = (np.where(cuts > 0, left >= cuts, left > cuts) !=
+                    np.where(cuts > 0, right >= cuts, right > cuts))
+        rows, segments = np.nonzero(crossing.any(axis=1))
+        if rows.size:
+            row_cuts = activations[rows]
+            x1, x2 = universe[segments], universe[segments + 1]
+            y1, y2 = left[:, segments].T, right[:, segments].T
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cut_points = x1[:, None] + (row_cuts - y1) * (x2 - x1)[:, None] / (y2 - y1)
+            cut_points = np.where(crossing[rows, :, segments], cut_points, x2[:, None])
+
+            points = np.sort(np.column_stack([x1, cut_points, x2]), axis=1)
+            position = (points - x1[:, None]) / (x2 - x1)[:, None]
+            term_values = y1[:, :, None] + (y2 - y1)[:, :, None] * position[:, None, :]
+            values = np.minimum(term_values, row_cuts[:, :, None]).max(axis=1)
+
+            segment_area, segment_moment = _segment_moments(points[:, :-1], points[:, 1:],
+                                                            values[:, :-1], values[:, 1:])
+            area[rows, segments] = segment_area.sum(axis=1)
+            moment[rows, segments] = segment_moment.sum(axis=1)
+
+        total_area = area.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total_area > 0, moment.sum(axis=1) / total_area, np.nan)
+
+    def analytic_centroid(self, activations):
+        """
+        Exact centroid of the clipped and max-aggregated trimf/trapmf terms.
+
+        The aggregated output is piecewise linear, with breakpoints at the term
+        vertices, at the edges' crossings with every cut level and at the edges'
+        crossings with each other. Sorting those per row and integrating each
+        piece with Gauss-Legendre nodes gives the true centroid without sampling
+        the universe. Rows with an empty output are NaN.
+        """
+        if self.output_shapes is None:
+            raise ValueError("analytic_centroid needs the output_shapes of the consequent terms")
+        a, b, c, d = self.output_shapes.T
+        lower, upper = self.output_universe[0], self.output_universe[-1]
+
+        # Where each term's rising and falling edges reach each row's cut levels
+        levels = activations[:, None, :]
+        rising = a[None, :, None] + levels * (b - a)[None, :, None]
+        falling = d[None, :, None] - levels * (d - c)[None, :, None]
+        size = len(activations)
+        points = np.concatenate([np.broadcast_to(self.fixed_breakpoints, (size, len(self.fixed_breakpoints))),
+                                 np.clip(rising.reshape(size, -1), lower, upper),
+                                 np.clip(falling.reshape(size, -1), lower, upper)], axis=1)
+        points.sort(axis=1)
+
+        # The output is linear between consecutive points, so two nodes per piece are exact
+        start, width = points[:, :-1], np.diff(points, axis=1)
+        nodes = start[:, :, None] + width[:, :, None] * _GAUSS_NODES
+        x = nodes[..., None]
+        rise = np.where(self.rise_vertical, x >= a, np.clip((x - a) * self.rise_slope, 0.0, 1.0))
+        fall = np.where(self.fall_vertical, x <= d, np.clip((d - x) * self.fall_slope, 0.0, 1.0))
+        values = np.minimum(np.minimum(rise, fall), activations[:, None, None, :]).max(axis=3)
+
+        area = 0.5 * (width[:, :, None] * values).sum(axis=(1, 2))
+        moment = 0.5 * (width[:, :, None] * values * nodes).sum(axis=(1, 2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(area > 0, moment / area, np.nan)
+
+    def takagi_sugeno(self, inputs, coefficients, chunk_size=8192, fuzzifier=None):
+        """
+        Takagi-Sugeno output for a list of equal-length input arrays.
+
+        coefficients holds one row per compiled rule: a constant followed by
+        one slope per input (all slopes zero for a zero-order system). The
+        output is the firing-strength weighted average of the rule outputs,
+        NaN where no rule fires or an input is NaN. fuzzifier is as in compute().
+        """
+        fuzzify = self.fuzzify if fuzzifier is None else fuzzifier.fuzzify
+        inputs = self._check_inputs(inputs)
+        coefficients = np.asarray(coefficients, dtype=float)
+        if coefficients.shape != (len(self.rule_weights), len(inputs) + 1):
+            raise ValueError(f"Expected coefficients of shape {(len(self.rule_weights), len(inputs) + 1)}")
+
+        size = len(inputs[0])
+        output = np.empty(size)
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            chunk = [values[start:stop] for values in inputs]
+            output[start:stop] = self.weighted_rule_outputs(self.rule_strengths(fuzzify(chunk)),
+                                                            chunk, coefficients)
+        return output
+
+    def weighted_rule_outputs(self, strengths, inputs, coefficients):
+        """Takagi-Sugeno output for known firing strengths, NaN where no rule fires"""
+        rule_outputs = coefficients[:, 0] + self.clipped_inputs(inputs) @ coefficients[:, 1:].T
+        total = strengths.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total > 0, (strengths * rule_outputs).sum(axis=1) / total, np.nan)
+
+    def normalized_strengths(self, inputs):
+        """Rule firing strengths divided by their row sum, and a mask of rows where any rule fires"""
+        strengths = self.rule_strengths(self.fuzzify(self._check_inputs(inputs)))
+        total = strengths.sum(axis=1, keepdims=True)
+        fired = total[:, 0] > 0
+        return np.divide(strengths, total, out=np.zeros_like(strengths), where=total > 0), fired
+
+    def clipped_inputs(self, inputs):
+        """Inputs clipped to their universes, as a (rows x inputs) matrix"""
+        return np.column_stack([np.clip(values, universe[0], universe[-1])
+                                for universe, values in zip(self.universes, inputs)])
+
+    def _check_inputs(self, inputs):
+        inputs = [np.asarray(values, dtype=float).ravel() for values in inputs]
+        if len(inputs) != len(self.input_labels):
+            raise ValueError(f"Expected {len(self.input_labels)} inputs, got {len(inputs)}")
+        size = len(inputs[0])
+        if any(len(values) != size for values in inputs):
+            raise ValueError("All input arrays must have the same length")
+        return inputs
+
+    def compute(self, inputs, chunk_size=8192, defuzzify='sampled', fuzzifier=None):
+        """
+        Crisp output for a list of equal-length input arrays, NaN where no rule
+        fires or an input is NaN.
+
+        defuzzify: 'sampled' reproduces skfuzzy's centroid, 'analytic' uses analytic_centroid()
+        fuzzifier: optional object whose fuzzify() replaces this one's, such as
+        a LookupFuzzifier built for this rule base
+        """
+        if defuzzify not in ('sampled', 'analytic'):
+            raise ValueError(f"Unknown defuzzification: {defuzzify}")
+        fuzzify = self.fuzzify if fuzzifier is None else fuzzifier.fuzzify
+        inputs = self._check_inputs(inputs)
+        size = len(inputs[0])
+
+        # Process in chunks so the (rows x terms x universe) arrays stay small
+        output = np.empty(size)
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            memberships = fuzzify([values[start:stop] for values in inputs])
+            activations = self.activations(self.rule_strengths(memberships))
+            if defuzzify == 'analytic':
+                output[start:stop] = self.analytic_centroid(activations)
+            else:
+                output[start:stop] = self.centroid(activations)
+        return output
+
+    def compute_one(self, *values, defuzzify='sampled'):
+        """Crisp output for a single set of scalar inputs, NaN if no rule fires or an input is NaN"""
+        memberships = self.fuzzify([np.array([value], dtype=float) for value in values])
+        activations = self.activations(self.rule_strengths(memberships))
+        if defuzzify == 'analytic':
+            return float(self.analytic_centroid(activations)[0])
+        if defuzzify != 'sampled':
+            raise ValueError(f"Unknown defuzzification: {defuzzify}")
+        cuts = activations[0]
+        universe = self.output_universe
+        term_mfs = self.output_term_mfs
+
+        # Single-row version of centroid(): upsample the universe at the cut
+        # points of every term, then integrate the aggregated polyline
+        above = np.where(cuts[:, None] > 0, term_mfs >= cuts[:, None], term_mfs > cuts[:, None])
+        terms, segments = np.nonzero(above[:, :-1] != above[:, 1:])
+        y1, y2 = term_mfs[terms, segments], term_mfs[terms, segments + 1]
+        x1, x2 = universe[segments], universe[segments + 1]
+        points = np.union1d(universe, x1 + (cuts[terms] - y1) * (x2 - x1) / (y2 - y1))
+
+        position = np.interp(points, universe, self.output_grid_positions)
+        index = np.minimum(position.astype(np.intp), len(universe) - 2)
+        fraction = position - index
+        left, right = term_mfs[:, index], term_mfs[:, index + 1]
+        output_mf = np.minimum(left + (right - left) * fraction, cuts[:, None]).max(axis=0)
+
+        area, moment = _segment_moments(points[:-1], points[1:], output_mf[:-1], output_mf[1:])
+        total_area = area.sum()
+        return float(moment.sum() / total_area) if total_area > 0 else float('nan')
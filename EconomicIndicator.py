@@ -1,5 +1,10 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from Membership import NO_TERM_LABEL, strongest_term, trapezoid
+
+ECONOMIC_CONDITIONS = ('Negative', 'Neutral', 'Positive')
+# Trapezoid (a, b, c, d) of each economic condition, in the order of ECONOMIC_CONDITIONS
+ECONOMIC_CONDITION_TERMS = ((0, 0, 20, 30), (30, 40, 60, 70), (70, 80, 100, 100))
 
 
 class EconomicIndicatorFuzzy:
@@ -15,54 +20,37 @@ class EconomicIndicatorFuzzy:
         a, b: Left trapezoid base
         c, d: Right trapezoid base
         """
-        # Ensure input is numpy array
-        x = np.asarray(x)
-
-        # Create result array with same shape as x
-        membership = np.zeros_like(x, dtype=float)
-
-        # Safely handle division by zero
-        if b == a:
-            b = a + 1e-10  # Add a small value to avoid division by zero
-
-        # Calculate membership
-        # Left rising interval
-        mask1 = (x >= a) & (x <= b)
-        membership[mask1] = (x[mask1] - a) / (b - a)
-
-        # Flat top interval
-        mask2 = (x > b) & (x < c)
-        membership[mask2] = 1.0
-
-        # Safely handle division by zero
-        if d == c:
-            d = c + 1e-10  # Add a small value to avoid division by zero
-
-        # Right descending interval
-        mask3 = (x >= c) & (x <= d)
-        membership[mask3] = np.maximum(0, (d - x[mask3]) / (d - c))
-
-        # Outside interval is 0
-        membership[(x < a) | (x > d)] = 0.0
-
-        return membership
+        return trapezoid(x, a, b, c, d)
 
     def determine_economic_condition(self, economic_value):
         """
-        Determine economic condition based on input value
+        Determine economic condition based on input value; for an array of
+        values, returns an array of conditions (NO_TERM_LABEL for NaN)
         """
-        negative = self.trapezoidal_membership(economic_value, 0, 0, 20, 30)
-        neutral = self.trapezoidal_membership(economic_value, 30, 40, 60, 70)
-        positive = self.trapezoidal_membership(economic_value, 70, 80, 100, 100)
+        codes, _ = self.determine_economic_condition_batch(economic_value)
+        if codes.ndim == 0:
+            return (ECONOMIC_CONDITIONS + (NO_TERM_LABEL,))[codes]
+        return np.array(ECONOMIC_CONDITIONS + (NO_TERM_LABEL,))[codes]
 
-        if negative > neutral and negative > positive:
-            return "Negative"
-        elif neutral > negative and neutral > positive:
-            return "Neutral"
-        else:
-            return "Positive"
+    def determine_economic_condition_batch(self, economic_values):
+        """
+        Economic condition of every value in an array, in one argmax pass: int8
+        indices into ECONOMIC_CONDITIONS (-1 for NaN) and their memberships.
+        A condition wins only with a strictly highest membership; ties, such as
+        the all-zero memberships at 30, 70 and outside 0-100, are Positive.
+        """
+        economic_values = np.asarray(economic_values, dtype=float)
+        memberships = np.empty((len(ECONOMIC_CONDITION_TERMS),) + economic_values.shape)
+        for index, terms in enumerate(ECONOMIC_CONDITION_TERMS):
+            trapezoid(economic_values, *terms, out=memberships[index, ...])
+        codes, best = strongest_term(memberships)
+        tied = (memberships == best).sum(axis=0) > 1
+        codes[tied] = len(ECONOMIC_CONDITIONS) - 1
+        return codes, np.where(tied, memberships[-1], best)
 
     def generate_economic_indicator_plot(self, economic_value):
+        import matplotlib.pyplot as plt
+
         # Create figure
         plt.figure(figsize=(12, 7))
 
@@ -0,0 +1,258 @@
+import warnings
+
+import numpy as np
+
+from StreamScoring import NO_RECOMMENDATION, RECOMMENDATIONS, recommendation_codes
+
+DEFUZZIFIERS = ('sampled', 'analytic')
+
+
+def consensus(scores):
+    """
+    Per-row agreement of a (rows x models) score matrix: mean, std, min and
+    max of the scores that fired, the number of models that fired, the
+    majority recommendation code and the fraction of models that gave it.
+    """
+    scores = np.asarray(scores, dtype=float)
+    codes = recommendation_codes(scores)
+    votes = np.stack([(codes == code).sum(axis=1) for code in range(len(RECOMMENDATIONS))], axis=1)
+    fired = (~np.isnan(scores)).sum(axis=1)
+    majority = votes.argmax(axis=1).astype(np.int8)
+    majority[fired == 0] = NO_RECOMMENDATION
+    with warnings.catch_warnings():
+        # Rows where no model fired are all NaN and stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {
+            'mean': np.nanmean(scores, axis=1),
+            'std': np.nanstd(scores, axis=1),
+            'min': np.nanmin(scores, axis=1),
+            'max': np.nanmax(scores, axis=1),
+            'fired': fired,
+            'recommendation_code': majority,
+            'agreement': votes.max(axis=1) / scores.shape[1]
+        }
+
+
+class EnsembleEvaluator:
+    """
+    Scores one batch with several compiled rule bases and defuzzifiers while
+    fuzzifying the inputs only once.
+
+    Terms that are the same membership function on the same universe (the
+    shared trapmf input terms of the Mamdani and Sugeno models, say) get a
+    single column in a shared membership matrix, and every member's rule
+    table is re-indexed into that matrix. Members that use the same rule
+    base with different defuzzifiers also share rule strengths and
+    activations. Every member's scores are identical to its own compute().
+    """
+
+    def __init__(self):
+        self.names = []
+        self._members = []
+        self._layout = None
+
+    def add(self, name, source, defuzzify=None, tsk_coefficients=None):
+        """
+        Add a member scored in column len(names). source is a CompiledRuleBase
+        or anything holding one as compiled_rule_base (a model, a snapshot, a
+        RuleBaseRegistry version); defuzzify and, for Takagi-Sugeno models,
+        the consequent coefficients default to the source's own settings.
+        """
+        if name in self.names:
+            raise ValueError(f"Ensemble already has a member named {name!r}")
+        rule_base = getattr(source, 'compiled_rule_base', source)
+        if defuzzify is None:
+            defuzzify = getattr(source, 'defuzzify', 'sampled')
+        if defuzzify not in DEFUZZIFIERS:
+            raise ValueError(f"Unknown defuzzification: {defuzzify}")
+        if tsk_coefficients is None and getattr(source, 'inference', 'mamdani') != 'mamdani':
+            tsk_coefficients = source._active_tsk_coefficients()
+        if self._members and len(rule_base.input_labels) != len(self._members[0][0].input_labels):
+            raise ValueError("All ensemble members must take the same inputs")
+        self.names.append(name)
+        self._members.append((rule_base, defuzzify, tsk_coefficients))
+        self._layout = None
+        return self
+
+    @classmethod
+    def from_registry(cls, registry, defuzzifiers=('sampled',)):
+        """
+        Ensemble of the current version of every rule base in a
+        RuleBaseRegistry, once per defuzzifier ('name:defuzzifier' when there
+        are several). Later reloads are not followed; build a new ensemble.
+        """
+        ensemble = cls()
+        for name in registry.names():
+            version = registry.get(name)
+            for defuzzify in defuzzifiers:
+                label = name if len(defuzzifiers) == 1 else f"{name}:{defuzzify}"
+                ensemble.add(label, version.compiled_rule_base, defuzzify)
+        return ensemble
+
+    def _build_layout(self):
+        # Distinct (input, universe) pairs and distinct term mfs on them
+        universes, universe_keys = [], {}
+        term_universes, term_mfs, term_keys = [], [], {}
+        member_columns = {}
+        for rule_base, _, _ in self._members:
+            if id(rule_base) in member_columns:
+                continue
+            universe_ids = []
+            for index, universe in enumerate(rule_base.universes):
+                key = (index, universe.tobytes())
+                if key not in universe_keys:
+                    universe_keys[key] = len(universes)
+                    universes.append((index, universe))
+                universe_ids.append(universe_keys[key])
+            columns = []
+            for term, variable in enumerate(rule_base.term_variables):
+                start = rule_base.term_offsets[term]
+                mf = rule_base.flat_term_mfs[start:start + rule_base.term_last_segments[term] + 2]
+                key = (universe_ids[variable], mf.tobytes())
+                if key not in term_keys:
+                    term_keys[key] = len(term_mfs)
+                    term_universes.append(universe_ids[variable])
+                    term_mfs.append(mf)
+                columns.append(term_keys[key])
+            member_columns[id(rule_base)] = columns
+
+        # Shared columns: terms, complements of negated terms, then constant 0 and 1
+        negated = sorted({member_columns[id(rule_base)][column] for rule_base, _, _ in self._members
+                          for column in rule_base.negated_columns})
+        zero_column = len(term_mfs) + len(negated)
+        rule_terms = []
+        for rule_base, _, _ in self._members:
+            columns = member_columns[id(rule_base)]
+            column_map = np.array(columns + [len(term_mfs) + negated.index(columns[column])
+                                             for column in rule_base.negated_columns]
+                                  + [zero_column, zero_column + 1], dtype=np.intp)
+            rule_terms.append(column_map[rule_base.rule_terms])
+
+        self._layout = {
+            'universes': [(index, universe, np.arange(len(universe), dtype=float)) for index, universe in universes],
+            'term_universes': np.array(term_universes, dtype=np.intp),
+            'term_offsets': np.cumsum([0] + [len(mf) for mf in term_mfs[:-1]]).astype(np.intp),
+            'term_last_segments': np.array([len(mf) - 2 for mf in term_mfs], dtype=np.intp),
+            'flat_term_mfs': np.concatenate(term_mfs),
+            'negated': negated,
+            'zero_column': zero_column,
+            'rule_terms': rule_terms
+        }
+
+    @property
+    def shared_columns(self):
+        """Membership columns fuzzified per row, against the sum over members without sharing"""
+        if self._layout is None:
+            self._build_layout()
+        separate = sum(len(rule_base.term_variables) + len(rule_base.negated_columns)
+                       for rule_base, _, _ in self._members)
+        return self._layout['zero_column'], separate
+
+    def fuzzify(self, inputs):
+        """
+        Shared membership matrix (rows x columns), interpolated exactly like
+        CompiledRuleBase.fuzzify, with rows that have a NaN input all NaN
+        """
+        layout = self._layout
+        size = len(inputs[0])
+        zero_column = layout['zero_column']
+        memberships = np.empty((size, zero_column + 2))
+
+        positions = np.column_stack([np.interp(inputs[index], universe, grid)
+                                     for index, universe, grid in layout['universes']])
+        missing = np.isnan(positions)
+        if missing.any():
+            positions[missing] = 0.0
+        positions = positions[:, layout['term_universes']]
+        index = np.minimum(positions.astype(np.intp), layout['term_last_segments'])
+        fraction = positions - index
+        index += layout['term_offsets']
+        left, right = layout['flat_term_mfs'][index], layout['flat_term_mfs'][index + 1]
+        column = len(layout['term_universes'])
+        memberships[:, :column] = left + (right - left) * fraction
+
+        for offset, negated in enumerate(layout['negated']):
+            memberships[:, column + offset] = 1.0 - memberships[:, negated]
+        memberships[:, zero_column] = 0.0
+        memberships[:, zero_column + 1] = 1.0
+        if missing.any():
+            memberships[missing.any(axis=1)] = np.nan
+        return memberships
+
+    def score(self, *inputs, chunk_size=8192, with_consensus=False):
+        """
+        (rows x members) score matrix for equal-length input arrays, columns
+        in the order of names, NaN where a member's rules do not fire. With
+        with_consensus, also returns consensus() of the matrix.
+        """
+        if not self._members:
+            raise ValueError("The ensemble has no members")
+        if self._layout is None:
+            self._build_layout()
+        inputs = self._members[0][0]._check_inputs(inputs)
+        size = len(inputs[0])
+        scores = np.empty((size, len(self._members)))
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            chunk = [values[start:stop] for values in inputs]
+            memberships = self.fuzzify(chunk)
+            strengths, activations = {}, {}
+            for column, ((rule_base, defuzzify, coefficients), rule_terms) in enumerate(
+                    zip(self._members, self._layout['rule_terms'])):
+                key = id(rule_base)
+                if key not in strengths:
+                    strengths[key] = memberships[:, rule_terms].max(axis=3).min(axis=2) * rule_base.rule_weights
+                if coefficients is not None:
+                    scores[start:stop, column] = rule_base.weighted_rule_outputs(strengths[key], chunk,
+                                                                                 np.asarray(coefficients, dtype=float))
+                    continue
+                if key not in activations:
+                    activations[key] = rule_base.activations(strengths[key])
+                if defuzzify == 'analytic':
+                    scores[start:stop, column] = rule_base.analytic_centroid(activations[key])
+                else:
+                    scores[start:stop, column] = rule_base.centroid(activations[key])
+        if with_consensus:
+            return scores, consensus(scores)
+        return scores
+
+
+def main():
+    import time
+
+    from RuleBaseRegistry import RuleBaseRegistry
+    from ShardedScoring import synthetic_book
+    from SugenoValidate import PortfolioAdjustmentFuzzySugeno
+
+    rows = int(input("Synthetic clients to score (e.g. 100000): "))
+    book = synthetic_book(rows)
+    registry = RuleBaseRegistry()
+    ensemble = EnsembleEvaluator.from_registry(registry, defuzzifiers=('sampled', 'analytic'))
+    ensemble.add('sugeno-validate:zero_order', PortfolioAdjustmentFuzzySugeno(engine='compiled',
+                                                                                inference='zero_order'))
+    shared, separate = ensemble.shared_columns
+    print(f"{len(ensemble.names)} members, {shared} shared membership columns instead of {separate}")
+
+    # Warm up both paths on a few rows so neither pays first-call costs in the timing
+    ensemble.score(*[values[:100] for values in book])
+    start = time.perf_counter()
+    separate_scores = []
+    for rule_base, defuzzify, coefficients in ensemble._members:
+        if coefficients is None:
+            separate_scores.append(rule_base.compute(list(book), defuzzify=defuzzify))
+        else:
+            separate_scores.append(rule_base.takagi_sugeno(list(book), coefficients))
+    separate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores, stats = ensemble.score(*book, with_consensus=True)
+    ensemble_seconds = time.perf_counter() - start
+
+    print(f"Members one by one: {separate_seconds:.2f} s, ensemble: {ensemble_seconds:.2f} s")
+    print(f"Identical to separate scoring: {np.array_equal(scores, np.column_stack(separate_scores), equal_nan=True)}")
+    print(f"Rows where every member agrees on the recommendation: {np.mean(stats['agreement'] == 1):.1%}")
+    print(f"Mean spread between members: {np.nanmean(stats['max'] - stats['min']):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,36 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from Membership import NO_TERM_LABEL, piecewise_linear, sigmoid, strongest_term
+
+HORIZON_TYPES = ('Short-term', 'Balanced', 'Long-term')
 
 
 class InvestmentHorizonFuzzy:
     def __init__(self):
         self.months_universe = np.linspace(0, 120, 200)
 
-    def short_term_membership(self, x):
-        """Membership function for short-term investment (0-12 months)"""
-        return 1 - 1 / (1 + np.exp(-0.5 * (x - 6)))
+    def short_term_membership(self, x, out=None):
+        """Membership function for short-term investment (0-12 months); x may be a number or an array"""
+        return sigmoid(x, 6, -0.5, out=out)
 
-    def balanced_membership(self, x):
-        """Membership function for balanced investment (12-36 months)"""
-        if 12 <= x <= 36:
-            return 1.0
-        elif x < 12:
-            return (x - 0) / (12 - 0)  # Linear increase
-        else:
-            return 1 - (x - 36) / (48 - 36)  # Linear decrease
+    def balanced_membership(self, x, out=None):
+        """Membership function for balanced investment (12-36 months); x may be a number or an array"""
+        # Linear increase to 12 months, flat to 36, linear decrease to 0 at 48
+        return piecewise_linear(x, [0, 12, 36, 48], [0, 1, 1, 0], out=out)
 
-    def long_term_membership(self, x):
-        """Membership function for long-term investment (>36 months)"""
-        return 1 / (1 + np.exp(-0.1 * (x - 72)))
+    def long_term_membership(self, x, out=None):
+        """Membership function for long-term investment (>36 months); x may be a number or an array"""
+        return sigmoid(x, 72, 0.1, out=out)
 
     def plot_membership_functions(self, input_value):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(15, 8))
 
         # Calculate membership for each function
-        short_term_values = [self.short_term_membership(x) for x in self.months_universe]
-        balanced_values = [self.balanced_membership(x) for x in self.months_universe]
-        long_term_values = [self.long_term_membership(x) for x in self.months_universe]
+        short_term_values = self.short_term_membership(self.months_universe)
+        balanced_values = self.balanced_membership(self.months_universe)
+        long_term_values = self.long_term_membership(self.months_universe)
 
         # Plot membership functions
         plt.plot(self.months_universe, short_term_values, label='Short-term', color='blue')
@@ -65,18 +66,28 @@ class InvestmentHorizonFuzzy:
         return input_short, input_balanced, input_long
 
     def determine_investment_horizon(self, input_value):
-        short_membership = self.short_term_membership(input_value)
-        balanced_membership = self.balanced_membership(input_value)
-        long_membership = self.long_term_membership(input_value)
-
-        memberships = {
-            'Short-term': short_membership,
-            'Balanced': balanced_membership,
-            'Long-term': long_membership
-        }
-
-        horizon_type = max(memberships, key=memberships.get)
-        return horizon_type, memberships[horizon_type]
+        """
+        Horizon type with the highest membership and that membership. For an
+        array of months, returns an array of horizon types and an array of
+        memberships; ties go to the shorter horizon either way, and NaN months
+        are NO_TERM_LABEL.
+        """
+        codes, membership = self.determine_investment_horizon_batch(input_value)
+        if codes.ndim == 0:
+            return (HORIZON_TYPES + (NO_TERM_LABEL,))[codes], float(membership)
+        return np.array(HORIZON_TYPES + (NO_TERM_LABEL,))[codes], membership
+
+    def determine_investment_horizon_batch(self, months):
+        """
+        Horizon of every value in an array, in one argmax pass: int8 indices
+        into HORIZON_TYPES (-1 for NaN) and their memberships
+        """
+        months = np.asarray(months, dtype=float)
+        memberships = np.empty((len(HORIZON_TYPES),) + months.shape)
+        self.short_term_membership(months, out=memberships[0, ...])
+        self.balanced_membership(months, out=memberships[1, ...])
+        self.long_term_membership(months, out=memberships[2, ...])
+        return strongest_term(memberships)
 
 
 def main():
@@ -11,6 +11,16 @@ from MarketCondition import MarketConditionFuzzy
 from EconomicIndicator import EconomicIndicatorFuzzy
 from FinancialGoal import InvestmentHorizonFuzzy
 from PortfolioDiv import determine_diversification_level
+from SimulatorPool import SimulatorPool
+from ResultCache import ResultCache
+
+
+@st.cache_resource
+def get_scoring_pool(model_type):
+    # 每个模型只构建一次，所有会话共用同一个模拟器池；滑块都是整数，按整数缓存得分
+    model = (PortfolioAdjustmentFuzzySystem() if model_type == "Mamdani Model"
+             else PortfolioAdjustmentFuzzySugeno())
+    return SimulatorPool(model, result_cache=ResultCache(quantum=1))
 
 
 def plot_to_base64(plt):
@@ -145,9 +155,9 @@ def create_financial_goal_visualization(input_value):
     financial_goal_system = InvestmentHorizonFuzzy()
     universe = np.linspace(0, 120, 200)
 
-    short_term_values = [financial_goal_system.short_term_membership(x) for x in universe]
-    balanced_values = [financial_goal_system.balanced_membership(x) for x in universe]
-    long_term_values = [financial_goal_system.long_term_membership(x) for x in universe]
+    short_term_values = financial_goal_system.short_term_membership(universe)
+    balanced_values = financial_goal_system.balanced_membership(universe)
+    long_term_values = financial_goal_system.long_term_membership(universe)
 
     plt.figure(figsize=(10, 6))
     plt.plot(universe, short_term_values, label='Short-term', color='blue')
@@ -285,12 +295,11 @@ def main():
         st.title("📊 Intelligent Portfolio Adjustment Fuzzy Inference System ( By Group 10 of APU)")
 
         if analyze_button:
-            # 初始化模糊系统
-            fuzzy_system = (PortfolioAdjustmentFuzzySystem() if model_type == "Mamdani Model"
-                            else PortfolioAdjustmentFuzzySugeno())
+            # 共享的模糊系统模拟器池
+            scoring_pool = get_scoring_pool(model_type)
 
             # 计算调整得分
-            adjustment_score = fuzzy_system.compute_portfolio_adjustment(
+            adjustment_score = scoring_pool.compute_portfolio_adjustment(
                 risk_tolerance,
                 market_condition,
                 economic_indicator,
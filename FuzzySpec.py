@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import Headless  # noqa: F401 - keeps skfuzzy.control from importing matplotlib.pyplot
+
+SPEC_FORMAT_VERSION = 1
+# Specs shipped with the repo, loadable by name (file name without .json)
+SPEC_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'specs')
+
+# Membership shapes a spec may use and the number of parameters each takes,
+# in skfuzzy's argument order
+MEMBERSHIP_SHAPES = {'trimf': 3, 'trapmf': 4, 'gaussmf': 2, 'gbellmf': 3, 'sigmf': 2}
+# Output shapes CompiledRuleBase can defuzzify analytically
+LINEAR_SHAPES = ('trimf', 'trapmf')
+DEFUZZIFY_METHODS = ('centroid', 'bisector', 'mom', 'som', 'lom')
+
+_TOKEN = re.compile(r"\s*(?:(?P<variable>\w+)\[(?P<term>\w+)\]|(?P<operator>[&|~()]))")
+
+
+def _tokenize(expression):
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None:
+            raise ValueError(f"Cannot parse rule antecedent {expression!r} at {expression[position:]!r}")
+        if match.group('operator'):
+            tokens.append(match.group('operator'))
+        else:
+            tokens.append(['term', match.group('variable'), match.group('term')])
+        position = match.end()
+    return tokens
+
+
+def parse_antecedent(expression):
+    """
+    Parse a rule antecedent such as "(risk_tolerance[high] | portfolio_diversification[good])
+    & economic_indicators[positive]" into a nested list tree of ['term', variable, term],
+    ['not', x], ['and', x, y] and ['or', x, y]. Operators bind as in Python:
+    ~ before & before |, and chains group from the left.
+    """
+    tokens = _tokenize(expression)
+
+    def parse_binary(position, operator, parse_operand):
+        tree, position = parse_operand(position)
+        while position < len(tokens) and tokens[position] == operator:
+            right, position = parse_operand(position + 1)
+            tree = ['and' if operator == '&' else 'or', tree, right]
+        return tree, position
+
+    def parse_or(position):
+        return parse_binary(position, '|', parse_and)
+
+    def parse_and(position):
+        return parse_binary(position, '&', parse_unary)
+
+    def parse_unary(position):
+        if position >= len(tokens):
+            raise ValueError(f"Rule antecedent {expression!r} ends early")
+        token = tokens[position]
+        if token == '~':
+            operand, position = parse_unary(position + 1)
+            return ['not', operand], position
+        if token == '(':
+            tree, position = parse_or(position + 1)
+            if position >= len(tokens) or tokens[position] != ')':
+                raise ValueError(f"Unbalanced parentheses in rule antecedent {expression!r}")
+            return tree, position + 1
+        if isinstance(token, list):
+            return token, position + 1
+        raise ValueError(f"Unexpected {token!r} in rule antecedent {expression!r}")
+
+    tree, position = parse_or(0)
+    if position != len(tokens):
+        raise ValueError(f"Unexpected {tokens[position]!r} in rule antecedent {expression!r}")
+    return tree
+
+
+def _canonical_variable(variable, kind):
+    universe = variable['universe']
+    if int(universe['points']) < 2 or not universe['stop'] > universe['start']:
+        raise ValueError(f"Variable {variable['label']!r} needs an increasing universe of at least 2 points")
+    terms = []
+    for term in variable['terms']:
+        shape = term['shape']
+        if shape not in MEMBERSHIP_SHAPES:
+            raise ValueError(f"Term {variable['label']}[{term['label']}] has unknown shape {shape!r}")
+        if len(term['params']) != MEMBERSHIP_SHAPES[shape]:
+            raise ValueError(f"Term {variable['label']}[{term['label']}] needs "
+                             f"{MEMBERSHIP_SHAPES[shape]} {shape} parameters")
+        terms.append({'label': term['label'], 'shape': shape, 'params': [float(value) for value in term['params']]})
+    labels = [term['label'] for term in terms]
+    if not labels or len(set(labels)) != len(labels):
+        raise ValueError(f"Variable {variable['label']!r} needs terms with distinct labels")
+    canonical = {'label': variable['label'], 'kind': kind,
+                 'universe': [float(universe['start']), float(universe['stop']), int(universe['points'])],
+                 'terms': terms}
+    if kind == 'output':
+        canonical['defuzzify_method'] = variable.get('defuzzify_method', 'centroid')
+        if canonical['defuzzify_method'] not in DEFUZZIFY_METHODS:
+            raise ValueError(f"Unknown defuzzify method {canonical['defuzzify_method']!r}")
+    return canonical
+
+
+def _check_tree(tree, terms_by_variable):
+    if tree[0] == 'term':
+        if tree[2] not in terms_by_variable.get(tree[1], ()):
+            raise ValueError(f"Rule uses unknown term {tree[1]}[{tree[2]}]")
+        return
+    for operand in tree[1:]:
+        _check_tree(operand, terms_by_variable)
+
+
+def canonical_spec(document):
+    """
+    The part of a spec document that decides what it computes, validated and
+    normalized: numbers as floats, rule antecedents parsed to trees, and the
+    name, description and rule comments left out. Two documents with the same
+    canonical form score every input the same.
+    """
+    if document.get('format_version') != SPEC_FORMAT_VERSION:
+        raise ValueError(f"Spec format {document.get('format_version')} is not the supported "
+                         f"version {SPEC_FORMAT_VERSION}")
+    inputs = [_canonical_variable(variable, 'input') for variable in document['inputs']]
+    output = _canonical_variable(document['output'], 'output')
+    labels = [variable['label'] for variable in inputs] + [output['label']]
+    if len(set(labels)) != len(labels):
+        raise ValueError("Variable labels must be distinct")
+
+    terms_by_variable = {variable['label']: [term['label'] for term in variable['terms']] for variable in inputs}
+    output_terms = [term['label'] for term in output['terms']]
+    rules = []
+    for rule in document['rules']:
+        tree = parse_antecedent(rule['if'])
+        _check_tree(tree, terms_by_variable)
+        if rule['then'] not in output_terms:
+            raise ValueError(f"Rule consequent {rule['then']!r} is not a term of {output['label']!r}")
+        rules.append({'if': tree, 'then': rule['then'], 'weight': float(rule.get('weight', 1.0))})
+    if not rules:
+        raise ValueError("A spec needs at least one rule")
+    return {'format_version': SPEC_FORMAT_VERSION, 'inputs': inputs, 'output': output, 'rules': rules}
+
+
+def _digest(canonical):
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def spec_hash(document):
+    """SHA-256 of the canonical JSON form; unchanged by key order, formatting and comments"""
+    return _digest(canonical_spec(document))
+
+
+def spec_path(source):
+    """File of a .json path or of the name of a spec in specs/"""
+    path = os.fspath(source)
+    if not path.lower().endswith('.json'):
+        path = os.path.join(SPEC_DIRECTORY, path + '.json')
+    return path
+
+
+def load_spec(source):
+    """FuzzySpec from a FuzzySpec, a spec document (dict), a .json path or the name of a spec in specs/"""
+    if isinstance(source, FuzzySpec):
+        return source
+    if isinstance(source, dict):
+        return FuzzySpec(source)
+    with open(spec_path(source)) as handle:
+        return FuzzySpec(json.load(handle))
+
+
+class FuzzySpec:
+    """
+    Declarative description of a Mamdani rule base: input and output variables
+    with their universes and terms, and rules written as antecedent
+    expressions over variable[term]. build_control_system() turns it into the
+    skfuzzy reference system, compile() into a CompiledRuleBase, and
+    content_hash identifies what it computes for caches and snapshots.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.canonical = canonical_spec(document)
+        self.content_hash = _digest(self.canonical)
+
+    @property
+    def name(self):
+        return self.document.get('name', self.content_hash[:12])
+
+    @property
+    def input_labels(self):
+        return [variable['label'] for variable in self.canonical['inputs']]
+
+    @property
+    def output_label(self):
+        return self.canonical['output']['label']
+
+    def output_shapes(self):
+        """{term label: parameters} of the output terms, or None unless all are trimf/trapmf"""
+        terms = self.canonical['output']['terms']
+        if any(term['shape'] not in LINEAR_SHAPES for term in terms):
+            return None
+        return {term['label']: term['params'] for term in terms}
+
+    def save(self, path):
+        with open(path, 'w') as handle:
+            json.dump(self.document, handle, indent=2)
+            handle.write('\n')
+
+    @staticmethod
+    def _membership(universe, term):
+        import skfuzzy as fuzz
+
+        function = getattr(fuzz, term['shape'])
+        if term['shape'] in LINEAR_SHAPES:
+            return function(universe, term['params'])
+        return function(universe, *term['params'])
+
+    def _build_variable(self, variable):
+        from skfuzzy import control as ctrl
+
+        universe = np.linspace(*variable['universe'])
+        if variable['kind'] == 'input':
+            built = ctrl.Antecedent(universe, variable['label'])
+        else:
+            built = ctrl.Consequent(universe, variable['label'], defuzzify_method=variable['defuzzify_method'])
+        for term in variable['terms']:
+            built[term['label']] = self._membership(universe, term)
+        return built
+
+    def _build_antecedent(self, tree, variables):
+        if tree[0] == 'term':
+            return variables[tree[1]][tree[2]]
+        if tree[0] == 'not':
+            return ~self._build_antecedent(tree[1], variables)
+        left = self._build_antecedent(tree[1], variables)
+        right = self._build_antecedent(tree[2], variables)
+        return left & right if tree[0] == 'and' else left | right
+
+    def build(self):
+        """(antecedents in input order, consequent, rules) as skfuzzy objects"""
+        from skfuzzy import control as ctrl
+
+        antecedents = [self._build_variable(variable) for variable in self.canonical['inputs']]
+        consequent = self._build_variable(self.canonical['output'])
+        variables = {antecedent.label: antecedent for antecedent in antecedents}
+        rules = []
+        for rule in self.canonical['rules']:
+            term = consequent[rule['then']]
+            rules.append(ctrl.Rule(self._build_antecedent(rule['if'], variables),
+                                   term if rule['weight'] == 1.0 else term % rule['weight']))
+        return antecedents, consequent, rules
+
+    def build_control_system(self):
+        """(antecedents, consequent, rules, ControlSystem): the skfuzzy reference system"""
+        from skfuzzy import control as ctrl
+
+        antecedents, consequent, rules = self.build()
+        return antecedents, consequent, rules, ctrl.ControlSystem(rules)
+
+    def compile(self):
+        """CompiledRuleBase of the spec, with analytic centroids when the output terms allow them"""
+        from CompiledRuleBase import CompiledRuleBase
+
+        antecedents, consequent, rules = self.build()
+        return CompiledRuleBase(antecedents, consequent, rules, output_shapes=self.output_shapes())
+
+
+def main():
+    from skfuzzy import control as ctrl
+
+    from ShardedScoring import synthetic_book
+
+    source = input("Spec name in specs/ or path to a spec .json (e.g. mamdani_validate): ")
+    spec = load_spec(source)
+    print(f"{spec.name}: {len(spec.input_labels)} inputs, {len(spec.canonical['rules'])} rules")
+    print(f"Content hash {spec.content_hash}")
+
+    if len(spec.input_labels) != 5:
+        return
+    # Score the same synthetic clients with both engines
+    control_system = spec.build_control_system()[3]
+    compiled = spec.compile()
+    book = synthetic_book(1000)
+    simulation_scores = []
+    simulation = ctrl.ControlSystemSimulation(control_system)
+    for row in zip(*book):
+        simulation.inputs(dict(zip(spec.input_labels, row)))
+        simulation.output.clear()
+        try:
+            simulation.compute()
+            simulation_scores.append(simulation.output[spec.output_label])
+        except KeyError:
+            # No rule fired
+            simulation_scores.append(np.nan)
+    difference = np.abs(compiled.compute(list(book)) - np.array(simulation_scores))
+    print(f"Largest difference between the skfuzzy system and the compiled engine: {np.nanmax(difference):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import importlib
+import sys
+import types
+
+
+class _DeferredModule(types.ModuleType):
+    """
+    Placeholder in sys.modules for a module that has not been imported yet.
+    The first attribute read imports the real module, and from then on every
+    lookup is handed to it.
+    """
+
+    def __getattr__(self, attribute):
+        # Only reached for attributes the placeholder does not hold itself
+        module = self.__dict__.get('_module')
+        if module is None:
+            if sys.modules.get(self.__name__) is self:
+                del sys.modules[self.__name__]
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_module'] = module
+        return getattr(module, attribute)
+
+
+def is_loaded(name):
+    """True once a module has really been imported, not just deferred"""
+    module = sys.modules.get(name)
+    return module is not None and not (isinstance(module, _DeferredModule) and '_module' not in module.__dict__)
+
+
+def defer_matplotlib():
+    """
+    Let `import matplotlib.pyplot` succeed without importing matplotlib until
+    it is actually used. skfuzzy.control imports pyplot for its visualizer on
+    import, which would otherwise cost every scoring process about a second.
+    """
+    if 'matplotlib.pyplot' in sys.modules:
+        return
+    pyplot = _DeferredModule('matplotlib.pyplot')
+    if 'matplotlib' not in sys.modules:
+        package = _DeferredModule('matplotlib')
+        # `import matplotlib.pyplot as plt` reads the attribute off the package
+        package.__dict__['pyplot'] = pyplot
+        sys.modules['matplotlib'] = package
+    sys.modules['matplotlib.pyplot'] = pyplot
+
+
+defer_matplotlib()
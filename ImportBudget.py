@@ -0,0 +1,63 @@
+import json
+import subprocess
+import sys
+
+# Modules a scoring worker may import, and what importing them must not load
+CORE_MODULES = ('CompiledRuleBase', 'MamdaniValidate', 'SugenoValidate', 'MarketCondition',
+                'EconomicIndicator', 'FinancialGoal', 'PortfolioDiv', 'RiskTolerance', 'ResultCache',
+                'SimulationCache', 'SimulatorPool', 'LookupSurrogate', 'IncrementalBook',
+                'ShardedScoring', 'StreamScoring', 'ClientBook', 'ModelSnapshot', 'FuzzySpec',
+                'RuleBaseRegistry', 'EnsembleScoring', 'RiskToleranceEngine', 'Membership', 'LookupFuzzifier')
+FORBIDDEN_MODULES = ('matplotlib', 'matplotlib.pyplot', 'streamlit')
+# Modules that load models from snapshots or read specs must not import skfuzzy at all
+SKFUZZY_FREE_MODULES = ('ModelSnapshot', 'FuzzySpec', 'Membership', 'LookupFuzzifier')
+# Import time in seconds allowed per module in a fresh interpreter (skfuzzy
+# itself, with scipy and networkx, takes most of it)
+IMPORT_BUDGET_SECONDS = 1.5
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import Headless
+print(json.dumps({{'seconds': elapsed,
+                  'loaded': [name for name in {forbidden!r} if Headless.is_loaded(name)]}}))
+"""
+
+
+def measure_import(module):
+    """Import time and forbidden modules loaded when importing module in a fresh interpreter"""
+    forbidden = FORBIDDEN_MODULES + (('skfuzzy',) if module in SKFUZZY_FREE_MODULES else ())
+    probe = _PROBE.format(module=module, forbidden=forbidden)
+    result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_import_budget(modules=CORE_MODULES, budget=IMPORT_BUDGET_SECONDS):
+    """Measurements per module, and a list of budget or headless violations"""
+    measurements, failures = {}, []
+    for module in modules:
+        measurement = measure_import(module)
+        measurements[module] = measurement
+        if measurement['loaded']:
+            failures.append(f"{module} imports {', '.join(measurement['loaded'])}")
+        if measurement['seconds'] > budget:
+            failures.append(f"{module} takes {measurement['seconds']:.2f} s to import, budget {budget:.2f} s")
+    return measurements, failures
+
+
+def main():
+    measurements, failures = check_import_budget()
+    for module, measurement in measurements.items():
+        print(f"{module:<20} {measurement['seconds']:6.3f} s")
+    if failures:
+        print("Import budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"All core modules import headless within {IMPORT_BUDGET_SECONDS} s")
+
+
+if __name__ == "__main__":
+    main()
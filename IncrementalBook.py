@@ -0,0 +1,198 @@
+import numpy as np
+
+
+class IncrementalBookScorer:
+    """
+    Scores a whole client book against market-wide readings, re-evaluating only
+    the rule clauses that involve those readings on each tick.
+
+    Every rule's firing strength is the minimum over its OR-clauses of the
+    maximum membership in each clause. The maximum over a clause splits into a
+    per-client part and a global part, so the client part of every clause is
+    computed once when clients are loaded. A tick then fuzzifies the global
+    readings once and combines them with the cached client parts for the whole
+    book; scores equal compute_portfolio_adjustment_batch on the full inputs.
+    Clients whose output cut levels come out unchanged keep their last score
+    without being defuzzified again.
+    """
+
+    def __init__(self, model, global_labels=('market_conditions', 'economic_indicators'), chunk_size=8192):
+        self.model = model
+        self.rule_base = model.compiled_rule_base
+        self.chunk_size = chunk_size
+        rule_base = self.rule_base
+
+        unknown = set(global_labels) - set(rule_base.input_labels)
+        if unknown:
+            raise ValueError(f"Unknown global inputs: {sorted(unknown)}")
+        self.global_labels = list(global_labels)
+        self.client_labels = [label for label in rule_base.input_labels if label not in global_labels]
+        self.global_indices = [rule_base.input_labels.index(label) for label in self.global_labels]
+        self.client_indices = [rule_base.input_labels.index(label) for label in self.client_labels]
+        self.client_lower = np.array([rule_base.universes[index][0] for index in self.client_indices])
+        self.client_upper = np.array([rule_base.universes[index][-1] for index in self.client_indices])
+
+        # Input variable behind each membership column (-1 for the constant columns)
+        column_variables = np.full(rule_base.n_columns, -1, dtype=np.intp)
+        terms = len(rule_base.term_variables)
+        column_variables[:terms] = rule_base.term_variables
+        column_variables[terms:rule_base.zero_column] = rule_base.term_variables[rule_base.negated_columns]
+        is_global = np.isin(column_variables, self.global_indices)[rule_base.rule_terms]
+
+        # Split every clause into its client and global columns; the zero column
+        # stands in for the other side, since it never changes a maximum
+        client_terms = np.where(is_global, rule_base.zero_column, rule_base.rule_terms)
+        global_terms = np.where(is_global, rule_base.rule_terms, rule_base.zero_column)
+        dynamic = is_global.any(axis=2)
+
+        # Clauses without a global column are reduced to one cached value per
+        # rule; the others keep their client part. Padding uses the one column,
+        # which never changes a minimum.
+        rules, _, width = rule_base.rule_terms.shape
+        static_count = max(1, int((~dynamic).sum(axis=1).max()))
+        dynamic_count = max(1, int(dynamic.sum(axis=1).max()))
+        self.static_terms = np.full((rules, static_count, width), rule_base.one_column, dtype=np.intp)
+        self.dynamic_client_terms = np.full((rules, dynamic_count, width), rule_base.one_column, dtype=np.intp)
+        self.dynamic_global_terms = np.full((rules, dynamic_count, width), rule_base.one_column, dtype=np.intp)
+        for rule in range(rules):
+            static_clauses, dynamic_clauses = np.flatnonzero(~dynamic[rule]), np.flatnonzero(dynamic[rule])
+            self.static_terms[rule, :len(static_clauses)] = client_terms[rule, static_clauses]
+            self.dynamic_client_terms[rule, :len(dynamic_clauses)] = client_terms[rule, dynamic_clauses]
+            self.dynamic_global_terms[rule, :len(dynamic_clauses)] = global_terms[rule, dynamic_clauses]
+
+        self.client_inputs = None
+        self.static_strengths = None
+        self.dynamic_client_parts = None
+        self.activations = None
+        self.scores = None
+
+    def _full_inputs(self, client_values, global_values, size):
+        # Inputs on the other side are placeholders; their columns are never read
+        inputs = [None] * len(self.rule_base.input_labels)
+        for index, values in zip(self.client_indices, client_values):
+            inputs[index] = values
+        for index, values in zip(self.global_indices, global_values):
+            inputs[index] = values
+        for index, universe in enumerate(self.rule_base.universes):
+            if inputs[index] is None:
+                inputs[index] = np.full(size, universe[0])
+        return inputs
+
+    def _client_parts(self, client_values):
+        memberships = self.rule_base.fuzzify(self._full_inputs(client_values, [], len(client_values[0])))
+        static = memberships[:, self.static_terms].max(axis=3).min(axis=2)
+        return static, memberships[:, self.dynamic_client_terms].max(axis=3)
+
+    def set_clients(self, *client_values):
+        """Load the book: one array per client input, in the order of client_labels"""
+        if len(client_values) != len(self.client_labels):
+            raise ValueError(f"Expected {len(self.client_labels)} client inputs: {self.client_labels}")
+        client_values = [np.asarray(values, dtype=float).ravel() for values in client_values]
+        size = len(client_values[0])
+        if any(len(values) != size for values in client_values):
+            raise ValueError("All client input arrays must have the same length")
+
+        self.client_inputs = np.column_stack(client_values)
+        self.static_strengths = np.empty((size, len(self.static_terms)))
+        self.dynamic_client_parts = np.empty((size,) + self.dynamic_client_terms.shape[:2])
+        for start in range(0, size, self.chunk_size):
+            stop = min(start + self.chunk_size, size)
+            self.static_strengths[start:stop], self.dynamic_client_parts[start:stop] = self._client_parts(
+                [values[start:stop] for values in client_values])
+        # NaN cut levels never match, so the first tick defuzzifies every client
+        self.activations = np.full((size, len(self.rule_base.output_terms)), np.nan)
+        self.scores = np.full(size, np.nan)
+
+    def update_clients(self, rows, *client_values):
+        """Replace the client inputs of the given rows and refresh only their cached parts"""
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.intp))
+        client_values = [np.broadcast_to(np.asarray(values, dtype=float).ravel(), rows.shape)
+                         for values in client_values]
+        self.client_inputs[rows] = np.column_stack(client_values)
+        self.static_strengths[rows], self.dynamic_client_parts[rows] = self._client_parts(client_values)
+        self.activations[rows] = np.nan
+
+    def score(self, *global_values):
+        """
+        Scores for the whole book under new global readings (scalars, in the
+        order of global_labels), NaN for clients where no rule fires
+        """
+        if self.client_inputs is None:
+            raise ValueError("Load the book with set_clients() first")
+        if len(global_values) != len(self.global_labels):
+            raise ValueError(f"Expected {len(self.global_labels)} global inputs: {self.global_labels}")
+        rule_base = self.rule_base
+        global_memberships = rule_base.fuzzify(
+            self._full_inputs([], [np.array([float(value)]) for value in global_values], 1))[0]
+        global_parts = global_memberships[self.dynamic_global_terms].max(axis=2)
+
+        inference = getattr(self.model, 'inference', 'mamdani')
+        if inference != 'mamdani':
+            coefficients = self.model._active_tsk_coefficients()
+            clipped_globals = np.array([np.clip(value, rule_base.universes[index][0], rule_base.universes[index][-1])
+                                        for index, value in zip(self.global_indices, global_values)])
+            global_outputs = coefficients[:, 0] + coefficients[:, 1:][:, self.global_indices] @ clipped_globals
+            client_slopes = coefficients[:, 1:][:, self.client_indices]
+
+        size = len(self.client_inputs)
+        for start in range(0, size, self.chunk_size):
+            stop = min(start + self.chunk_size, size)
+            dynamic = np.maximum(self.dynamic_client_parts[start:stop], global_parts).min(axis=2)
+            strengths = np.minimum(self.static_strengths[start:stop], dynamic) * rule_base.rule_weights
+
+            if inference != 'mamdani':
+                clipped_clients = np.clip(self.client_inputs[start:stop], self.client_lower, self.client_upper)
+                rule_outputs = global_outputs + clipped_clients @ client_slopes.T
+                total = strengths.sum(axis=1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    self.scores[start:stop] = np.where(total > 0, (strengths * rule_outputs).sum(axis=1) / total,
+                                                       np.nan)
+                continue
+
+            # Defuzzification dominates the cost, so only clients whose output
+            # cut levels moved since the last tick are defuzzified again
+            activations = rule_base.activations(strengths)
+            changed = start + np.flatnonzero((activations != self.activations[start:stop]).any(axis=1))
+            if changed.size:
+                moved = activations[changed - start]
+                if self.model.defuzzify == 'analytic':
+                    self.scores[changed] = rule_base.analytic_centroid(moved)
+                else:
+                    self.scores[changed] = rule_base.centroid(moved)
+                self.activations[changed] = moved
+        return self.scores.copy()
+
+
+def main():
+    import time
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    clients = int(input("Clients in the book (e.g. 100000): "))
+    rng = np.random.default_rng(0)
+    risk_tolerance = rng.uniform(0, 100, clients)
+    portfolio_div = rng.uniform(0, 100, clients)
+    financial_goal = rng.uniform(0, 120, clients)
+
+    model = PortfolioAdjustmentFuzzySystem()
+    book = IncrementalBookScorer(model)
+    start = time.perf_counter()
+    book.set_clients(risk_tolerance, portfolio_div, financial_goal)
+    print(f"Cached client memberships in {time.perf_counter() - start:.2f} s")
+
+    for market_condition, economic_indicator in [(35, 60), (55, 60), (55, 45)]:
+        start = time.perf_counter()
+        scores = book.score(market_condition, economic_indicator)
+        incremental = time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = model.compute_portfolio_adjustment_batch(risk_tolerance, np.full(clients, market_condition),
+                                                        np.full(clients, economic_indicator),
+                                                        portfolio_div, financial_goal)
+        rescored = time.perf_counter() - start
+        print(f"Tick ({market_condition}, {economic_indicator}): incremental {incremental:.2f} s, "
+              f"full batch {rescored:.2f} s, max difference {np.nanmax(np.abs(scores - full)):.2e}")
+
+
+if __name__ == "__main__":
+    main()
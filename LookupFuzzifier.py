@@ -0,0 +1,272 @@
+import numpy as np
+
+from Membership import gaussian, generalized_bell, sigmoid, trapezoid, triangle
+
+# Default spacing of the table points, in input units
+DEFAULT_RESOLUTION = 0.01
+# Membership functions of the spec term shapes, taking the spec parameters in order
+SHAPE_FUNCTIONS = {'trimf': triangle, 'trapmf': trapezoid, 'gaussmf': gaussian,
+                   'sigmf': sigmoid, 'gbellmf': generalized_bell}
+
+
+def _shape_function(shape, params):
+    function = SHAPE_FUNCTIONS[shape]
+    return lambda x: function(x, *params)
+
+
+def spec_membership_functions(spec):
+    """{(variable, term): membership function} of the analytic input terms of a FuzzySpec"""
+    return {(variable['label'], term['label']): _shape_function(term['shape'], term['params'])
+            for variable in spec.canonical['inputs'] for term in variable['terms']}
+
+
+def spec_breakpoints(spec):
+    """{variable: parameters of its trimf/trapmf terms}, where tabulating their kinks errs most"""
+    return {variable['label']: [value for term in variable['terms'] if term['shape'] in ('trimf', 'trapmf')
+                                for value in term['params']]
+            for variable in spec.canonical['inputs']}
+
+
+class MembershipTable:
+    """
+    Memberships of the terms of one variable, tabulated at a fixed step from
+    start to stop and answered by index arithmetic: linear interpolation
+    between the two neighbouring points, or the nearest point with
+    interpolate=False. Inputs outside [start, stop] get the end values, as
+    skfuzzy clips inputs to the universe, and NaN inputs get NaN memberships.
+    grid optionally gives the evenly spaced points from start to stop to
+    tabulate at, instead of resolution.
+    """
+
+    def __init__(self, functions, start, stop, resolution=DEFAULT_RESOLUTION, interpolate=True, grid=None):
+        if not resolution > 0 or not stop > start:
+            raise ValueError("Tables need a positive resolution and start < stop")
+        self.functions = list(functions)
+        self.start = float(start)
+        self.stop = float(stop)
+        if grid is None:
+            # Enough points that the step is at most resolution
+            points = int(np.ceil((self.stop - self.start) / resolution - 1e-9)) + 1
+            grid = np.linspace(self.start, self.stop, points)
+        self.grid = np.asarray(grid, dtype=float)
+        self.step = (self.stop - self.start) / (len(self.grid) - 1)
+        self.interpolate = interpolate
+        # One row per term, so each lookup is a 1-D take
+        self.table = np.array([np.asarray(function(self.grid), dtype=float) for function in self.functions])
+        # Slope to the next point; the last point is never left by a fraction > 0
+        self.slopes = np.hstack([np.diff(self.table, axis=1), np.zeros((len(self.functions), 1))])
+
+    def lookup(self, values, out=None):
+        """Memberships (terms x values) of a 1-D array of values, written into out when given"""
+        position = np.clip(values, self.start, self.stop)
+        missing = np.isnan(position)
+        if missing.any():
+            # Any in-range position keeps the take valid; these values are overwritten below
+            position[missing] = self.start
+        position -= self.start
+        position *= 1.0 / self.step
+        if out is None:
+            out = np.empty((len(self.functions), len(position)))
+        if not self.interpolate:
+            index = np.rint(position).astype(np.intp)
+            for term, row in enumerate(self.table):
+                row.take(index, out=out[term])
+        else:
+            index = np.minimum(position.astype(np.intp), len(self.grid) - 1)
+            position -= index
+            for term, (row, slopes) in enumerate(zip(self.table, self.slopes)):
+                slopes.take(index, out=out[term])
+                out[term] *= position
+                out[term] += row.take(index)
+        if missing.any():
+            out[:, missing] = np.nan
+        return out
+
+    def max_error(self, samples=100000, seed=0, points=None):
+        """
+        Largest absolute difference from the functions over the table range,
+        probed at every grid midpoint, at random points and at points (the
+        kinks of piecewise-linear functions, where interpolation errs most)
+        """
+        rng = np.random.default_rng(seed)
+        probes = [(self.grid[:-1] + self.grid[1:]) / 2, rng.uniform(self.start, self.stop, samples)]
+        if points is not None:
+            probes.append(np.clip(np.asarray(points, dtype=float), self.start, self.stop))
+        probes = np.concatenate(probes)
+        exact = np.array([function(probes) for function in self.functions])
+        return float(np.abs(self.lookup(probes) - exact).max())
+
+
+class LookupFuzzifier:
+    """
+    Drop-in replacement for CompiledRuleBase.fuzzify that reads every term
+    membership from one MembershipTable per input variable instead of
+    interpolating the sampled universe.
+
+    By default the tables hold the engine's own interpolated memberships on a
+    step (at most resolution) that divides the universe step, so they
+    reproduce them up to rounding. functions maps (variable, term) to another
+    membership function of one value to tabulate instead, such as
+    spec_membership_functions() for the exact spec shapes rather than their
+    samples on the universe.
+
+    errors holds the measured maximum error of each variable's table against
+    the functions it tabulates, max_error the largest. engine_error is the
+    largest difference from rule_base.fuzzify, which is what decides whether
+    scores stay with the engine's; tables of other functions can have a tiny
+    max_error and still a large engine_error.
+    """
+
+    def __init__(self, rule_base, resolution=DEFAULT_RESOLUTION, interpolate=True, functions=None,
+                 probe_points=None, engine_samples=20000):
+        self.rule_base = rule_base
+        self.resolution = resolution
+        self.interpolate = interpolate
+        functions = functions or {}
+        probe_points = probe_points or {}
+        labels = {column: key for key, column in rule_base.term_columns.items()}
+
+        self.tables = []
+        self.errors = {}
+        for variable, (label, universe) in enumerate(zip(rule_base.input_labels, rule_base.universes)):
+            columns = np.flatnonzero(rule_base.term_variables == variable)
+            if not columns.size:
+                continue
+            grid = None
+            if not any(labels[column] in functions for column in columns):
+                # Split every universe step into whole table steps, so the table has a point
+                # exactly at each sample and reproduces the engine's piecewise-linear memberships
+                universe_step = (universe[-1] - universe[0]) / (len(universe) - 1)
+                splits = np.ceil(universe_step / resolution - 1e-9)
+                fractions = np.arange(splits) / splits
+                grid = np.append((universe[:-1, None] + np.diff(universe)[:, None] * fractions).ravel(),
+                                 universe[-1])
+            term_functions = [functions.get(labels[column], self._engine_membership(column, universe))
+                              for column in columns]
+            table = MembershipTable(term_functions, universe[0], universe[-1], resolution, interpolate, grid)
+            # Terms of one variable are consecutive columns
+            self.tables.append((variable, slice(columns[0], columns[-1] + 1), table))
+            self.errors[label] = table.max_error(
+                points=np.concatenate([universe, probe_points.get(label, [])]))
+        self.max_error = max(self.errors.values())
+        self.engine_error = self.engine_deviation(engine_samples)
+
+    def _engine_membership(self, column, universe):
+        rule_base = self.rule_base
+        start = rule_base.term_offsets[column]
+        mf = rule_base.flat_term_mfs[start:start + rule_base.term_last_segments[column] + 2]
+        return lambda x: np.interp(x, universe, mf)
+
+    def engine_deviation(self, samples=20000, seed=0):
+        """
+        Largest absolute difference of fuzzify() from rule_base.fuzzify, probed
+        at every universe sample and midpoint and at random inputs
+        """
+        rng = np.random.default_rng(seed)
+        universes = self.rule_base.universes
+        fixed = [np.concatenate([universe, (universe[:-1] + universe[1:]) / 2]) for universe in universes]
+        rows = max(len(values) for values in fixed) + samples
+        inputs = [np.concatenate([values, rng.uniform(universe[0], universe[-1], rows - len(values))])
+                  for values, universe in zip(fixed, universes)]
+        return float(np.abs(self.fuzzify(inputs) - self.rule_base.fuzzify(inputs)).max())
+
+    def built_for(self, rule_base):
+        """Whether rule_base has the variables, universes and terms this fuzzifier was built from"""
+        built = self.rule_base
+        return (rule_base.term_columns == built.term_columns and
+                len(rule_base.universes) == len(built.universes) and
+                all(np.array_equal(universe, other)
+                    for universe, other in zip(rule_base.universes, built.universes)) and
+                np.array_equal(rule_base.flat_term_mfs, built.flat_term_mfs))
+
+    @property
+    def table_bytes(self):
+        return sum(table.table.nbytes + table.slopes.nbytes for _, _, table in self.tables)
+
+    def fuzzify(self, inputs):
+        """
+        Membership matrix (rows x columns) laid out like CompiledRuleBase.fuzzify,
+        with rows that have a NaN input all NaN
+        """
+        rule_base = self.rule_base
+        memberships = np.empty((len(inputs[0]), rule_base.n_columns))
+        for variable, columns, table in self.tables:
+            memberships[:, columns] = table.lookup(inputs[variable]).T
+        missing = np.isnan(np.column_stack(inputs)).any(axis=1)
+
+        column = len(rule_base.term_variables)
+        for offset, negated in enumerate(rule_base.negated_columns):
+            memberships[:, column + offset] = 1.0 - memberships[:, negated]
+        memberships[:, rule_base.zero_column] = 0.0
+        memberships[:, rule_base.one_column] = 1.0
+        if missing.any():
+            memberships[missing] = np.nan
+        return memberships
+
+
+def main():
+    import time
+
+    from CompiledRuleBase import BATCH_TOLERANCE
+    from FinancialGoal import InvestmentHorizonFuzzy
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+    from ShardedScoring import synthetic_book
+
+    resolution = float(input(f"Table resolution in input units (e.g. {DEFAULT_RESOLUTION}): "))
+    rows = 200000
+    months = np.random.default_rng(0).uniform(0, 120, rows)
+
+    # Sigmoid horizon memberships: np.exp per call against one table gather
+    horizon = InvestmentHorizonFuzzy()
+    horizon_table = MembershipTable([horizon.short_term_membership, horizon.balanced_membership,
+                                     horizon.long_term_membership], 0, 120, resolution)
+    start = time.perf_counter()
+    for function in horizon_table.functions:
+        function(months)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    horizon_table.lookup(months)
+    table_seconds = time.perf_counter() - start
+    print(f"Investment horizon: {1e3 * exact_seconds:.1f} ms exact, {1e3 * table_seconds:.1f} ms from the table, "
+          f"max error {horizon_table.max_error(points=[0, 12, 36, 48]):.2e}")
+
+    # Portfolio model batch path
+    model = PortfolioAdjustmentFuzzySystem(engine='compiled')
+    book = [values[:rows] for values in synthetic_book(rows)]
+    rule_base = model.compiled_rule_base
+    exact_scores = rule_base.compute(book)
+    fuzzifiers = {}
+    for name, functions, points in (('engine memberships', None, None),
+                                    ('analytic spec shapes', spec_membership_functions(model.spec),
+                                     spec_breakpoints(model.spec))):
+        fuzzifier = fuzzifiers[name] = LookupFuzzifier(rule_base, resolution, functions=functions,
+                                                       probe_points=points)
+        start = time.perf_counter()
+        exact = rule_base.fuzzify(book)
+        exact_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        tabulated = fuzzifier.fuzzify(book)
+        table_seconds = time.perf_counter() - start
+        scores = rule_base.compute(book, fuzzifier=fuzzifier)
+        print(f"\nTables of the {name} ({fuzzifier.table_bytes / 1024:.0f} KB):")
+        for label, error in fuzzifier.errors.items():
+            print(f"  {label:<26} max error {error:.2e}")
+        print(f"  Largest difference from the engine's memberships: {fuzzifier.engine_error:.2e}")
+        print(f"  Fuzzify: {1e3 * exact_seconds:.1f} ms exact, {1e3 * table_seconds:.1f} ms from the tables, "
+              f"memberships differ from the engine's by up to {np.abs(exact - tabulated).max():.2e}")
+        print(f"  Scores differ from the exact batch path by up to {np.nanmax(np.abs(scores - exact_scores)):.2e}")
+
+    # End to end with the engine tables attached
+    start = time.perf_counter()
+    model.compute_portfolio_adjustment_batch(*book)
+    exact_seconds = time.perf_counter() - start
+    model.attach_fuzzifier(fuzzifiers['engine memberships'], tolerance=BATCH_TOLERANCE)
+    start = time.perf_counter()
+    model.compute_portfolio_adjustment_batch(*book)
+    table_seconds = time.perf_counter() - start
+    print(f"\nBatch scoring of {rows} clients: {exact_seconds:.2f} s exact, "
+          f"{table_seconds:.2f} s with the engine tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ResultCache import model_fingerprint
+
+SURROGATE_FORMAT_VERSION = 1
+
+# Model built once per worker process by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_class, model_kwargs):
+    global _worker_model
+    _worker_model = model_class(**model_kwargs)
+
+
+def _score_slab(axes, first_index, model=None):
+    """
+    Scores of the grid slab whose first input sits at axes[0][first_index],
+    from model, or from the worker's model in a pool
+    """
+    model = _worker_model if model is None else model
+    rest = np.meshgrid(*axes[1:], indexing='ij')
+    inputs = [np.full(rest[0].size, axes[0][first_index])] + [values.ravel() for values in rest]
+    return model.compute_portfolio_adjustment_batch(*inputs).reshape(rest[0].shape)
+
+
+class LookupTableSurrogate:
+    """
+    Portfolio adjustment scores precomputed on a regular 5-D grid over the
+    input universes and answered by multilinear interpolation.
+
+    Grid points where no rule fires hold NaN, and so does any query that
+    touches them; callers fall back to the exact engine for those rows.
+    """
+
+    def __init__(self, axes, table, max_error=None, model_version=None):
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.table = np.asarray(table, dtype=np.float32)
+        if self.table.shape != tuple(len(axis) for axis in self.axes):
+            raise ValueError("Table shape does not match the grid axes")
+        self.max_error = max_error
+        # Fingerprint of the model the table was scored with
+        self.model_version = model_version
+
+    @staticmethod
+    def grid_axes(model, points=21):
+        """Evenly spaced grid axes over each input universe of the model"""
+        universes = model.compiled_rule_base.universes
+        if np.isscalar(points):
+            points = [points] * len(universes)
+        return [np.linspace(universe[0], universe[-1], count) for universe, count in zip(universes, points)]
+
+    @classmethod
+    def build(cls, model_class, points=21, workers=None, model_kwargs=None, validation_samples=2000, seed=0):
+        """
+        Score every grid point with model_class's exact batch engine, one
+        first-axis slab per task across a process pool (workers=1 stays
+        in-process), then measure the interpolation error on random inputs.
+        """
+        model_kwargs = model_kwargs or {}
+        # Built here rather than through _init_worker, which only pool workers run
+        model = model_class(**model_kwargs)
+        axes = cls.grid_axes(model, points)
+
+        if workers == 1:
+            slabs = [_score_slab(axes, index, model) for index in range(len(axes[0]))]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(model_class, model_kwargs)) as executor:
+                slabs = list(executor.map(_score_slab, itertools.repeat(axes), range(len(axes[0]))))
+
+        surrogate = cls(axes, np.stack(slabs), model_version=model_fingerprint(model))
+        surrogate.max_error = surrogate.interpolation_error(model, validation_samples, seed)
+        return surrogate
+
+    def interpolation_error(self, model, samples=2000, seed=0, percentile=100):
+        """
+        Absolute difference from the model on random inputs (the maximum by
+        default, or the given percentile), compared with
+        compute_portfolio_adjustment_batch, which matches
+        compute_portfolio_adjustment to within BATCH_TOLERANCE. Rows that
+        either side cannot score are left out.
+        """
+        if getattr(model, 'surrogate', None) is not None:
+            raise ValueError("Measure the error against a model without a surrogate attached")
+        rng = np.random.default_rng(seed)
+        inputs = [rng.uniform(axis[0], axis[-1], samples) for axis in self.axes]
+        difference = np.abs(self.compute(*inputs) - model.compute_portfolio_adjustment_batch(*inputs))
+        difference = difference[~np.isnan(difference)]
+        return float(np.percentile(difference, percentile)) if difference.size else float('nan')
+
+    def compute(self, *inputs):
+        """Interpolated scores for equal-length input arrays, NaN for rows with a NaN input"""
+        inputs = [np.asarray(values, dtype=float).ravel() for values in inputs]
+        if len(inputs) != len(self.axes):
+            raise ValueError(f"Expected {len(self.axes)} inputs, got {len(inputs)}")
+        size = len(inputs[0])
+        # A NaN position would cast to a garbage cell index, so only rows with every input known are looked up
+        known = ~np.logical_or.reduce([np.isnan(values) for values in inputs])
+        if not known.all():
+            inputs = [values[known] for values in inputs]
+
+        # Cell index and position inside the cell along every axis
+        indices, fractions = [], []
+        for axis, values in zip(self.axes, inputs):
+            position = np.interp(values, axis, np.arange(len(axis), dtype=float))
+            index = np.minimum(position.astype(np.intp), len(axis) - 2)
+            indices.append(index)
+            fractions.append(position - index)
+
+        # Weighted sum over the 2^5 corners of each cell
+        output = np.zeros(len(inputs[0]))
+        for corner in itertools.product((0, 1), repeat=len(self.axes)):
+            weight = np.ones(len(inputs[0]))
+            for offset, fraction in zip(corner, fractions):
+                weight *= fraction if offset else 1.0 - fraction
+            output += weight * self.table[tuple(index + offset for index, offset in zip(indices, corner))]
+        if len(output) == size:
+            return output
+        scores = np.full(size, np.nan)
+        scores[known] = output
+        return scores
+
+    def save(self, path):
+        """
+        Write the table as a float32 .npy, and its maximum error, grid shape
+        and model version to a path + '.json' sidecar; the axes follow from
+        the model universes
+        """
+        np.save(path, self.table)
+        metadata = {'format_version': SURROGATE_FORMAT_VERSION, 'max_error': self.max_error,
+                    'shape': list(self.table.shape), 'model_version': self.model_version}
+        with open(f"{path}.json", 'w') as handle:
+            json.dump(metadata, handle)
+
+    @classmethod
+    def load(cls, path, model, validation_samples=2000, seed=0):
+        """
+        Map a table written by save for model. Raises ValueError when the
+        sidecar's grid shape or model version does not match; without a
+        sidecar the maximum error is measured again against model.
+        """
+        if getattr(model, 'surrogate', None) is not None:
+            raise ValueError("Load the table for a model without a surrogate attached")
+        table = np.load(path, mmap_mode='r')
+        try:
+            with open(f"{path}.json") as handle:
+                metadata = json.load(handle)
+        except FileNotFoundError:
+            surrogate = cls(cls.grid_axes(model, table.shape), table, model_version=model_fingerprint(model))
+            surrogate.max_error = surrogate.interpolation_error(model, validation_samples, seed)
+            return surrogate
+
+        if metadata.get('format_version') != SURROGATE_FORMAT_VERSION:
+            raise ValueError(f"Surrogate format {metadata.get('format_version')} is not the supported "
+                             f"version {SURROGATE_FORMAT_VERSION}; rebuild the table")
+        if tuple(metadata['shape']) != table.shape:
+            raise ValueError(f"{path} holds a {table.shape} table, its sidecar says {tuple(metadata['shape'])}")
+        version = model_fingerprint(model)
+        if metadata['model_version'] != version:
+            raise ValueError(f"{path} was built for model version {metadata['model_version']}, not {version}")
+        return cls(cls.grid_axes(model, table.shape), table, metadata['max_error'], version)
+
+
+def main():
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    points = int(input("Grid points per input (e.g. 21): "))
+    surrogate = LookupTableSurrogate.build(PortfolioAdjustmentFuzzySystem, points)
+    path = f"portfolio_adjustment_lut_{points}.npy"
+    surrogate.save(path)
+    print(f"Saved {surrogate.table.size} grid points to {path}")
+    print(f"Maximum interpolation error: {surrogate.max_error:.4f}")
+
+    # Rows with a NaN input fall through to the exact engine instead of failing the batch
+    model = PortfolioAdjustmentFuzzySystem()
+    probe = [np.array([50.0, np.nan])] + [np.array([50.0, 50.0])] * 4
+    exact = model.compute_portfolio_adjustment_batch(*probe)
+    model.attach_surrogate(surrogate, surrogate.max_error)
+    scores = model.compute_portfolio_adjustment_batch(*probe)
+    if not (np.array_equal(np.isnan(scores), np.isnan(exact)) and
+            abs(scores[0] - exact[0]) <= surrogate.max_error + 1e-9):
+        raise AssertionError(f"Surrogate scores {scores} of a NaN row do not match the engine's {exact}")
+    percentile_error = surrogate.interpolation_error(PortfolioAdjustmentFuzzySystem(), percentile=99)
+    print(f"99th percentile error: {percentile_error:.4f}")
+
+
+if __name__ == "__main__":
+    main()
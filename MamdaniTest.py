@@ -367,9 +367,9 @@ def main():
 
             plt.figure(figsize=(10, 6))
             goal_universe = np.linspace(0, 120, 200)
-            short_term_values = [financial_goal_system.short_term_membership(x) for x in goal_universe]
-            balanced_values = [financial_goal_system.balanced_membership(x) for x in goal_universe]
-            long_term_values = [financial_goal_system.long_term_membership(x) for x in goal_universe]
+            short_term_values = financial_goal_system.short_term_membership(goal_universe)
+            balanced_values = financial_goal_system.balanced_membership(goal_universe)
+            long_term_values = financial_goal_system.long_term_membership(goal_universe)
 
             plt.plot(goal_universe, short_term_values, label='Short-term', color='blue')
             plt.plot(goal_universe, balanced_values, label='Balanced', color='green')
@@ -1,152 +1,86 @@
 import numpy as np
 import skfuzzy as fuzz
-from skfuzzy import control as ctrl
-import matplotlib.pyplot as plt
 
 from FinancialGoal import InvestmentHorizonFuzzy
 from MarketCondition import MarketConditionFuzzy
 from PortfolioDiv import determine_diversification_level
 from EconomicIndicator import EconomicIndicatorFuzzy
 from RiskTolerance import RiskToleranceCalculator
+from CompiledRuleBase import CompiledRuleBase
+from ResultCache import model_fingerprint
+from FuzzySpec import load_spec
+from SimulationCache import SIMULATION_CACHE_MODES, build_simulation, simulation_footprint
+from StreamScoring import INPUT_COLUMNS
 
 
 class PortfolioAdjustmentFuzzySystem:
-    def __init__(self):
-        # Input variables
-        self.risk_tolerance = ctrl.Antecedent(np.linspace(0, 100, 200), 'risk_tolerance')
-        self.market_conditions = ctrl.Antecedent(np.linspace(0, 100, 200), 'market_conditions')
-        self.economic_indicators = ctrl.Antecedent(np.linspace(0, 100, 200), 'economic_indicators')
-        self.portfolio_diversification = ctrl.Antecedent(np.linspace(0, 100, 200), 'portfolio_diversification')
-        self.financial_goals = ctrl.Antecedent(np.linspace(0, 120, 200), 'financial_goals')
-
-        # Output variable
-        self.portfolio_adjustment = ctrl.Consequent(np.linspace(0, 100, 200), 'portfolio_adjustment')
-
-        # Initialize fuzzy sets and rules
-        self._setup_fuzzy_sets()
-        self._define_rules()
-
-        # Create control system
-        self.control_system = ctrl.ControlSystem(self.rules)
-        self.simulator = ctrl.ControlSystemSimulation(self.control_system)
-
-    def _setup_fuzzy_sets(self):
-        # Fuzzy sets for each variable
-        # Risk Tolerance
-        self.risk_tolerance['low'] = fuzz.trapmf(self.risk_tolerance.universe, [0, 0, 20, 40])
-        self.risk_tolerance['medium'] = fuzz.trapmf(self.risk_tolerance.universe, [30, 40, 60, 70])
-        self.risk_tolerance['high'] = fuzz.trapmf(self.risk_tolerance.universe, [60, 70, 100, 100])
-
-        # Market Conditions
-        self.market_conditions['bearish'] = fuzz.trapmf(self.market_conditions.universe, [0, 0, 20, 40])
-        self.market_conditions['neutral'] = fuzz.trapmf(self.market_conditions.universe, [30, 40, 60, 70])
-        self.market_conditions['bullish'] = fuzz.trapmf(self.market_conditions.universe, [60, 70, 100, 100])
-
-        # Economic Indicators
-        self.economic_indicators['negative'] = fuzz.trapmf(self.economic_indicators.universe, [0, 0, 20, 40])
-        self.economic_indicators['positive'] = fuzz.trapmf(self.economic_indicators.universe, [60, 70, 100, 100])
-
-        # Portfolio Diversification
-        self.portfolio_diversification['poor'] = fuzz.trapmf(self.portfolio_diversification.universe, [0, 0, 20, 40])
-        self.portfolio_diversification['moderate'] = fuzz.trapmf(self.portfolio_diversification.universe, [30, 40, 60, 70])
-        self.portfolio_diversification['good'] = fuzz.trapmf(self.portfolio_diversification.universe, [60, 70, 100, 100])
-
-        # Financial Goals
-        self.financial_goals['short_term'] = fuzz.trapmf(self.financial_goals.universe, [0, 0, 20, 40])
-        self.financial_goals['balanced'] = fuzz.trapmf(self.financial_goals.universe, [30, 40, 60, 70])
-        self.financial_goals['long_term'] = fuzz.trapmf(self.financial_goals.universe, [60, 70, 120, 120])
-
-        # Portfolio Adjustment
-        self.portfolio_adjustment['diversify'] = fuzz.trapmf(self.portfolio_adjustment.universe, [0, 0, 20, 40])
-        self.portfolio_adjustment['rebalance'] = fuzz.trapmf(self.portfolio_adjustment.universe, [30, 40, 60, 70])
-        self.portfolio_adjustment['hold'] = fuzz.trapmf(self.portfolio_adjustment.universe, [60, 70, 100, 100])
-
-    def _define_rules(self):
-        # Define 10 fuzzy rules covering different scenarios
-        self.rules = [
-            # Rule 1: Low risk, bearish market, poor diversification
-            ctrl.Rule(
-                self.risk_tolerance['low'] &
-                self.market_conditions['bearish'] &
-                self.portfolio_diversification['poor'],
-                self.portfolio_adjustment['diversify']
-            ),
-
-            # Rule 2: Medium risk, negative economic indicators, long-term goals
-            ctrl.Rule(
-                self.risk_tolerance['medium'] &
-                self.economic_indicators['negative'] &
-                self.financial_goals['long_term'],
-                self.portfolio_adjustment['rebalance']
-            ),
-
-            # Rule 3: Bullish market, moderate diversification, balanced goals
-            ctrl.Rule(
-                self.market_conditions['bullish'] &
-                self.portfolio_diversification['moderate'] &
-                self.financial_goals['balanced'],
-                self.portfolio_adjustment['diversify']
-            ),
-
-            # Rule 4: High risk, positive economic indicators, short-term goals
-            ctrl.Rule(
-                self.risk_tolerance['high'] &
-                self.economic_indicators['positive'] &
-                self.financial_goals['short_term'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 5: Negative economic indicators or poor diversification, long-term goals
-            ctrl.Rule(
-                (self.economic_indicators['negative'] |
-                 self.portfolio_diversification['poor']) &
-                self.financial_goals['long_term'],
-                self.portfolio_adjustment['rebalance']
-            ),
-
-            # Rule 6: Low risk, neutral market, balanced goals
-            ctrl.Rule(
-                self.risk_tolerance['low'] &
-                self.market_conditions['neutral'] &
-                self.financial_goals['balanced'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 7: High risk or good diversification, positive economic indicators
-            ctrl.Rule(
-                (self.risk_tolerance['high'] |
-                 self.portfolio_diversification['good']) &
-                self.economic_indicators['positive'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 8: Bearish market, negative economic indicators, short-term goals
-            ctrl.Rule(
-                self.market_conditions['bearish'] &
-                self.economic_indicators['negative'] &
-                self.financial_goals['short_term'],
-                self.portfolio_adjustment['rebalance']
-            ),
-
-            # Rule 9: Neutral market or positive economic indicators, medium risk
-            ctrl.Rule(
-                (self.market_conditions['neutral'] |
-                 self.economic_indicators['positive']) &
-                self.risk_tolerance['medium'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 10: Low risk, negative economic indicators, poor diversification
-            ctrl.Rule(
-                self.risk_tolerance['low'] &
-                self.economic_indicators['negative'] &
-                self.portfolio_diversification['poor'],
-                self.portfolio_adjustment['diversify']
-            )
-        ]
+    def __init__(self, engine='skfuzzy', defuzzify='sampled', simulation_cache='flush',
+                 simulation_cache_size=1000, spec='mamdani_validate'):
+        """
+        engine: 'skfuzzy' runs compute_portfolio_adjustment through the skfuzzy
+        simulator, 'compiled' through the CompiledRuleBase arrays
+        defuzzify: 'sampled' is skfuzzy's centroid over the 200-point universe,
+        'analytic' the exact centroid of the trimf/trapmf output terms
+        (needs engine='compiled'; the skfuzzy engine rejects it)
+        simulation_cache: how the skfuzzy simulator caches per-input state,
+        'off', 'lru' (the last simulation_cache_size distinct inputs) or
+        'flush' (skfuzzy's default, cleared every simulation_cache_size runs)
+        spec: FuzzySpec, spec document, .json path or name of a spec in specs/
+        with the five portfolio inputs and the portfolio_adjustment output
+        """
+        if engine not in ('skfuzzy', 'compiled'):
+            raise ValueError(f"Unknown engine: {engine}")
+        if defuzzify not in ('sampled', 'analytic'):
+            raise ValueError(f"Unknown defuzzification: {defuzzify}")
+        if simulation_cache not in SIMULATION_CACHE_MODES:
+            raise ValueError(f"Unknown simulation cache mode: {simulation_cache}")
+        if engine == 'skfuzzy' and defuzzify == 'analytic':
+            raise ValueError("Analytic defuzzification needs engine='compiled'")
+        self.engine = engine
+        self.defuzzify = defuzzify
+        self.surrogate = None
+        self.fuzzifier = None
+        self.result_cache = None
+
+        # Variables, terms and rules come from the declarative spec
+        self.spec = load_spec(spec)
+        if self.spec.input_labels != list(INPUT_COLUMNS) or self.spec.output_label != 'portfolio_adjustment':
+            raise ValueError(f"Spec {self.spec.name!r} does not describe the portfolio adjustment variables")
+        antecedents, self.portfolio_adjustment, self.rules, self.control_system = self.spec.build_control_system()
+        (self.risk_tolerance, self.market_conditions, self.economic_indicators,
+         self.portfolio_diversification, self.financial_goals) = antecedents
+        self.adjustment_shapes = self.spec.output_shapes()
+
+        self.simulator = build_simulation(self.control_system, simulation_cache, simulation_cache_size)
+        self.compiled_rule_base = CompiledRuleBase(
+            [self.risk_tolerance, self.market_conditions, self.economic_indicators,
+             self.portfolio_diversification, self.financial_goals],
+            self.portfolio_adjustment, self.rules, output_shapes=self.adjustment_shapes)
 
     def compute_portfolio_adjustment(self, risk_tolerance, market_condition,
                                      economic_indicator, portfolio_div, financial_goal):
+        values = (risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal)
+        if self.result_cache is not None:
+            return self.result_cache.get_or_compute(self.fingerprint, values, self._compute_portfolio_adjustment)
+        return self._compute_portfolio_adjustment(*values)
+
+    def _compute_portfolio_adjustment(self, risk_tolerance, market_condition,
+                                      economic_indicator, portfolio_div, financial_goal):
+        if self.surrogate is not None:
+            score = self.surrogate.compute(risk_tolerance, market_condition, economic_indicator,
+                                           portfolio_div, financial_goal)[0]
+            if not np.isnan(score):
+                return float(score)
+
+        if self.engine == 'compiled':
+            score = self.compiled_rule_base.compute_one(risk_tolerance, market_condition, economic_indicator,
+                                                        portfolio_div, financial_goal,
+                                                        defuzzify=self.defuzzify)
+            if np.isnan(score):
+                # Same failure as the skfuzzy simulator when no rule fires
+                raise KeyError('portfolio_adjustment')
+            return score
+
         # Ensure input variable names match the system definition
         self.simulator.input['risk_tolerance'] = risk_tolerance
         self.simulator.input['market_conditions'] = market_condition
@@ -154,13 +88,98 @@ class PortfolioAdjustmentFuzzySystem:
         self.simulator.input['portfolio_diversification'] = portfolio_div
         self.simulator.input['financial_goals'] = financial_goal
 
-        # Compute results
+        # Compute results; a cached run only copies outputs that exist, so drop
+        # the last score or inputs where no rule fires would return it
+        self.simulator.output.clear()
         self.simulator.compute()
 
         # Return output
         return self.simulator.output['portfolio_adjustment']
 
+    def simulation_footprint(self):
+        """Per-input state held by the skfuzzy simulator, see SimulationCache.simulation_footprint"""
+        return simulation_footprint(self.simulator)
+
+    def attach_result_cache(self, cache):
+        """
+        Memoize compute_portfolio_adjustment in a ResultCache under this model's
+        fingerprint. Attach again after editing terms or rules by hand. Pass
+        None to detach.
+        """
+        self.result_cache = cache
+        self.fingerprint = model_fingerprint(self) if cache is not None else None
+
+    def compute_portfolio_adjustment_batch(self, risk_tolerance, market_condition,
+                                           economic_indicator, portfolio_div, financial_goal,
+                                           chunk_size=8192):
+        """
+        Vectorized compute_portfolio_adjustment for equal-length input arrays.
+
+        Runs the CompiledRuleBase, which follows the skfuzzy simulator step by
+        step (clipped inputs, interpolated memberships, min/max rules, centroid
+        over the universe upsampled at the cut points), so scores agree with
+        compute_portfolio_adjustment to within BATCH_TOLERANCE. With
+        defuzzify='analytic' the exact centroid is returned instead. Rows where
+        no rule fires, for which the scalar method raises KeyError, come back as NaN.
+        So do rows with a NaN input, which skfuzzy would still score by
+        ignoring that input's terms; the compiled scalar path raises KeyError.
+        """
+        inputs = [np.asarray(values, dtype=float).ravel() for values in
+                  (risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal)]
+        if self.surrogate is None:
+            return self.compiled_rule_base.compute(inputs, chunk_size=chunk_size, defuzzify=self.defuzzify,
+                                                   fuzzifier=self.fuzzifier)
+
+        # Rows the table cannot answer go through the exact engine
+        scores = self.surrogate.compute(*inputs)
+        missing = np.isnan(scores)
+        if missing.any():
+            scores[missing] = self.compiled_rule_base.compute([values[missing] for values in inputs],
+                                                              chunk_size=chunk_size, defuzzify=self.defuzzify,
+                                                              fuzzifier=self.fuzzifier)
+        return scores
+
+    def attach_surrogate(self, surrogate, tolerance):
+        """
+        Answer scores from a LookupTableSurrogate built for this model (its
+        model_version matches the fingerprint without a surrogate), provided
+        its measured maximum interpolation error is within tolerance. Pass
+        None to detach.
+        """
+        if surrogate is not None:
+            attached, self.surrogate = self.surrogate, None
+            try:
+                version = model_fingerprint(self)
+            finally:
+                self.surrogate = attached
+            if surrogate.model_version != version:
+                raise ValueError(f"The surrogate was built for model version {surrogate.model_version}, "
+                                 f"not {version}")
+            if not surrogate.max_error <= tolerance:
+                raise ValueError(f"Surrogate error {surrogate.max_error} exceeds tolerance {tolerance}")
+        self.surrogate = surrogate
+        # Scores now come from the table, so cached ones go under a new key
+        self.attach_result_cache(self.result_cache)
+
+    def attach_fuzzifier(self, fuzzifier, tolerance):
+        """
+        Fuzzify batches with a LookupFuzzifier built for compiled_rule_base,
+        provided its memberships differ from compiled_rule_base.fuzzify by at
+        most tolerance (its engine_error). Single scores keep the exact
+        memberships. Pass None to detach.
+        """
+        if fuzzifier is not None:
+            if not fuzzifier.built_for(self.compiled_rule_base):
+                raise ValueError("The fuzzifier was built for a different rule base")
+            if not fuzzifier.engine_error <= tolerance:
+                raise ValueError(f"Fuzzifier memberships differ from the engine's by {fuzzifier.engine_error}, "
+                                 f"more than tolerance {tolerance}")
+        self.fuzzifier = fuzzifier
+        self.attach_result_cache(self.result_cache)
+
     def visualize_final_decision(self, adjustment_score, recommendation):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(10, 6))
 
         # Create trapezoidal membership functions
@@ -246,6 +265,8 @@ def get_float_input(prompt, min_val=None, max_val=None):
 
 
 def main():
+    import matplotlib.pyplot as plt
+
     print("********* This is Mamdani Model *********")
 
     fuzzy_system = PortfolioAdjustmentFuzzySystem()
@@ -462,9 +483,9 @@ def main():
             # Financial Goal (Investment Horizon) Visualization
             plt.figure(figsize=(10, 6))
             goal_universe = np.linspace(0, 120, 200)
-            short_term_values = [financial_goal_system.short_term_membership(x) for x in goal_universe]
-            balanced_values = [financial_goal_system.balanced_membership(x) for x in goal_universe]
-            long_term_values = [financial_goal_system.long_term_membership(x) for x in goal_universe]
+            short_term_values = financial_goal_system.short_term_membership(goal_universe)
+            balanced_values = financial_goal_system.balanced_membership(goal_universe)
+            long_term_values = financial_goal_system.long_term_membership(goal_universe)
 
             plt.plot(goal_universe, short_term_values, label='Short-term', color='blue')
             plt.plot(goal_universe, balanced_values, label='Balanced', color='green')
@@ -1,5 +1,10 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from Membership import strongest_term, trapezoid
+
+MARKET_CONDITIONS = ('Bearish', 'Neutral', 'Bullish')
+# Trapezoid (a, b, c, d) of each market condition, in the order of MARKET_CONDITIONS
+MARKET_CONDITION_TERMS = ((0, 0, 20, 30), (30, 40, 60, 70), (70, 80, 100, 100))
 
 
 class MarketConditionFuzzy:
@@ -15,37 +20,7 @@ class MarketConditionFuzzy:
         a, b: Left trapezoid base
         c, d: Right trapezoid base
         """
-        # Ensure input is numpy array
-        x = np.asarray(x)
-
-        # Create result array with same shape as x
-        membership = np.zeros_like(x, dtype=float)
-
-        # Safely handle division by zero
-        if b == a:
-            b = a + 1e-10  # Add a small value to avoid division by zero
-
-        # Calculate membership
-        # Left rising interval
-        mask1 = (x >= a) & (x <= b)
-        membership[mask1] = (x[mask1] - a) / (b - a)
-
-        # Flat top interval
-        mask2 = (x > b) & (x < c)
-        membership[mask2] = 1.0
-
-        # Safely handle division by zero for right side
-        if d == c:
-            d = c + 1e-10  # Add a small value to avoid division by zero
-
-        # Right descending interval
-        mask3 = (x >= c) & (x <= d)
-        membership[mask3] = np.maximum(0, (d - x[mask3]) / (d - c))
-
-        # Outside interval is 0
-        membership[(x < a) | (x > d)] = 0.0
-
-        return membership
+        return trapezoid(x, a, b, c, d)
 
     def determine_market_condition(self, market_value):
         """
@@ -64,7 +39,20 @@ class MarketConditionFuzzy:
         market_condition = max(memberships, key=memberships.get)
         return market_condition, memberships[market_condition]
 
+    def determine_market_condition_batch(self, market_values):
+        """
+        Market condition of every value in an array, in one argmax pass: int8
+        indices into MARKET_CONDITIONS (-1 for NaN) and their memberships
+        """
+        market_values = np.asarray(market_values, dtype=float)
+        memberships = np.empty((len(MARKET_CONDITION_TERMS),) + market_values.shape)
+        for index, terms in enumerate(MARKET_CONDITION_TERMS):
+            trapezoid(market_values, *terms, out=memberships[index, ...])
+        return strongest_term(memberships)
+
     def generate_market_condition_plot(self, market_value):
+        import matplotlib.pyplot as plt
+
         # Create figure
         plt.figure(figsize=(14, 8))
 
@@ -0,0 +1,181 @@
+import numpy as np
+
+# Label code and label for values whose memberships are NaN; appending the
+# label to a tuple of term labels lets code -1 index it
+NO_TERM = -1
+NO_TERM_LABEL = "Undefined"
+
+
+def _prepare(x, out):
+    x = np.asarray(x, dtype=float)
+    if out is None:
+        return x, np.empty_like(x)
+    if out.shape != x.shape:
+        raise ValueError(f"out has shape {out.shape}, expected {x.shape}")
+    return x, out
+
+
+def _result(x, out, given):
+    # Scalars in, scalars out, so callers can compare and format the result
+    return out[()] if given is None and x.ndim == 0 else out
+
+
+def trapezoid(x, a, b, c, d, out=None):
+    """
+    Trapezoid membership of x (any shape) with feet a, d and shoulders b, c,
+    a <= b <= c <= d. Vertical edges (a == b or c == d) are 1 on the edge,
+    like skfuzzy.trapmf, whose values this matches exactly. Writes into out
+    when given, which may be x itself; the only temporary is the falling edge.
+    """
+    given = out
+    x, out = _prepare(x, out)
+    # Falling edge first: out may be x itself, and the rising edge overwrites it
+    falling = np.empty_like(out)
+    if d > c:
+        np.subtract(d, x, out=falling)
+        np.divide(falling, d - c, out=falling)
+    else:
+        np.less_equal(x, d, out=falling)
+    if b > a:
+        np.subtract(x, a, out=out)
+        np.divide(out, b - a, out=out)
+    else:
+        np.greater_equal(x, a, out=out)
+    # The edges are never both below 1 at once, so their minimum clipped to [0, 1] is the trapezoid
+    np.minimum(out, falling, out=out)
+    np.clip(out, 0.0, 1.0, out=out)
+    return _result(x, out, given)
+
+
+def triangle(x, a, b, c, out=None):
+    """Triangle membership with feet a, c and peak b, a <= b <= c"""
+    return trapezoid(x, a, b, b, c, out=out)
+
+
+def gaussian(x, mean, sigma, out=None):
+    """Gaussian membership exp(-(x - mean)^2 / (2 sigma^2)), computed in place"""
+    given = out
+    x, out = _prepare(x, out)
+    np.subtract(x, mean, out=out)
+    np.divide(out, sigma, out=out)
+    np.square(out, out=out)
+    np.multiply(out, -0.5, out=out)
+    np.exp(out, out=out)
+    return _result(x, out, given)
+
+
+def sigmoid(x, center, slope, out=None):
+    """Sigmoid membership 1 / (1 + exp(-slope (x - center))), rising for positive slope, computed in place"""
+    given = out
+    x, out = _prepare(x, out)
+    np.subtract(x, center, out=out)
+    np.multiply(out, -slope, out=out)
+    with np.errstate(over='ignore'):
+        # exp overflows to inf far down a steep slope, giving membership 0
+        np.exp(out, out=out)
+    np.add(out, 1.0, out=out)
+    np.reciprocal(out, out=out)
+    return _result(x, out, given)
+
+
+def generalized_bell(x, width, slope, center, out=None):
+    """Generalized bell membership 1 / (1 + |(x - center) / width|^(2 slope)), like skfuzzy.gbellmf"""
+    given = out
+    x, out = _prepare(x, out)
+    np.subtract(x, center, out=out)
+    np.divide(out, width, out=out)
+    np.abs(out, out=out)
+    np.power(out, 2 * slope, out=out)
+    np.add(out, 1.0, out=out)
+    np.reciprocal(out, out=out)
+    return _result(x, out, given)
+
+
+def piecewise_linear(x, points, values, out=None):
+    """
+    Membership interpolated linearly between (points, values) pairs, with
+    points increasing; constant beyond the first and last point. np.interp
+    has no out argument, so its result is copied into out when one is given.
+    """
+    given = out
+    x, out = _prepare(x, out)
+    out[...] = np.interp(x, points, values)
+    return _result(x, out, given)
+
+
+def strongest_term(memberships):
+    """
+    (codes, memberships) of the strongest term for a (terms x ...) stack of
+    membership arrays: int8 index of the first term with the highest
+    membership, NO_TERM where the memberships are NaN, and that membership.
+    """
+    codes = np.asarray(memberships.argmax(axis=0))
+    best = np.take_along_axis(memberships, codes[np.newaxis], axis=0)[0]
+    codes = codes.astype(np.int8)
+    # argmax stops at the first NaN, so a NaN anywhere shows up in best
+    codes[np.isnan(best)] = NO_TERM
+    return codes, best
+
+
+def allocation_benchmark(size=10000, repeats=200):
+    """
+    Peak temporary bytes and time per call of the old per-module trapezoids
+    and the shared one, with and without an out= buffer
+    """
+    import time
+    import tracemalloc
+
+    def masked_trapezoid(x, a, b, c, d):
+        # MarketConditionFuzzy / EconomicIndicatorFuzzy before this module
+        x = np.asarray(x)
+        membership = np.zeros_like(x, dtype=float)
+        if b == a:
+            b = a + 1e-10
+        mask1 = (x >= a) & (x <= b)
+        membership[mask1] = (x[mask1] - a) / (b - a)
+        mask2 = (x > b) & (x < c)
+        membership[mask2] = 1.0
+        if d == c:
+            d = c + 1e-10
+        mask3 = (x >= c) & (x <= d)
+        membership[mask3] = np.maximum(0, (d - x[mask3]) / (d - c))
+        membership[(x < a) | (x > d)] = 0.0
+        return membership
+
+    def slope_trapezoid(x, a, b, c, d):
+        # PortfolioDiv before this module
+        left_slope = (b - a) if (b - a) != 0 else 1e-6
+        right_slope = (d - c) if (d - c) != 0 else 1e-6
+        return np.maximum(np.minimum((x - a) / left_slope, np.minimum(1, (d - x) / right_slope)), 0)
+
+    x = np.random.default_rng(0).uniform(0, 100, size)
+    out = np.empty_like(x)
+    candidates = [('masked (Market/Economic)', lambda: masked_trapezoid(x, 30, 40, 60, 70)),
+                  ('slope (PortfolioDiv)', lambda: slope_trapezoid(x, 30, 40, 60, 70)),
+                  ('Membership.trapezoid', lambda: trapezoid(x, 30, 40, 60, 70)),
+                  ('Membership.trapezoid out=', lambda: trapezoid(x, 30, 40, 60, 70, out=out))]
+    results = []
+    for name, call in candidates:
+        call()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        call()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            call()
+        results.append((name, peak, (time.perf_counter() - start) / repeats))
+    return results
+
+
+def main():
+    size = int(input("Values per call (e.g. 10000): "))
+    print(f"{'implementation':<28} {'peak temporary':>16} {'time per call':>14}")
+    for name, peak, seconds in allocation_benchmark(size):
+        print(f"{name:<28} {peak / 1024:>13.1f} KB {1e6 * seconds:>11.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+
+from CompiledRuleBase import CompiledRuleBase
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def save_snapshot(model, path):
+    """
+    Write a model's compiled rule base, scoring settings and fingerprint to a
+    .npz snapshot. Loading it back needs neither skfuzzy nor the model class.
+    """
+    from ResultCache import model_fingerprint
+
+    arrays, rule_base_metadata = model.compiled_rule_base.state()
+    inference = getattr(model, 'inference', 'mamdani')
+    if inference != 'mamdani':
+        arrays = dict(arrays, tsk_coefficients=model._active_tsk_coefficients())
+    metadata = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'model_class': type(model).__name__,
+        'model_version': model_fingerprint(model),
+        'spec_hash': model.spec.content_hash if hasattr(model, 'spec') else None,
+        'defuzzify': model.defuzzify,
+        'inference': inference,
+        'rule_base': rule_base_metadata
+    }
+    np.savez(path, metadata=np.array(json.dumps(metadata)), **arrays)
+
+
+def load_snapshot(path):
+    """SnapshotModel from a file written by save_snapshot"""
+    with np.load(path, allow_pickle=False) as snapshot:
+        arrays = {name: snapshot[name] for name in snapshot.files}
+    metadata = json.loads(str(arrays.pop('metadata')))
+    if metadata.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Snapshot format {metadata.get('format_version')} is not the supported "
+                         f"version {SNAPSHOT_FORMAT_VERSION}; rebuild it with save_snapshot")
+    return SnapshotModel(CompiledRuleBase.from_state(arrays, metadata['rule_base']), metadata,
+                         arrays.get('tsk_coefficients'))
+
+
+class SnapshotModel:
+    """
+    Scoring-only model restored from a snapshot. It answers
+    compute_portfolio_adjustment and compute_portfolio_adjustment_batch like
+    the original model with engine='compiled', and has no skfuzzy objects.
+    """
+
+    def __init__(self, compiled_rule_base, metadata, tsk_coefficients=None):
+        self.compiled_rule_base = compiled_rule_base
+        self.model_class = metadata['model_class']
+        self.model_version = metadata['model_version']
+        self.spec_hash = metadata.get('spec_hash')
+        self.defuzzify = metadata['defuzzify']
+        self.inference = metadata['inference']
+        self.tsk_coefficients = tsk_coefficients
+        self.result_cache = None
+
+    def _active_tsk_coefficients(self):
+        return self.tsk_coefficients
+
+    def attach_result_cache(self, cache):
+        """Memoize compute_portfolio_adjustment in a ResultCache under the snapshot's model version"""
+        self.result_cache = cache
+        self.fingerprint = self.model_version if cache is not None else None
+
+    def compute_portfolio_adjustment(self, risk_tolerance, market_condition,
+                                     economic_indicator, portfolio_div, financial_goal):
+        values = (risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal)
+        if self.result_cache is not None:
+            return self.result_cache.get_or_compute(self.fingerprint, values, self._compute_portfolio_adjustment)
+        return self._compute_portfolio_adjustment(*values)
+
+    def _compute_portfolio_adjustment(self, *values):
+        if self.inference == 'mamdani':
+            score = self.compiled_rule_base.compute_one(*values, defuzzify=self.defuzzify)
+        else:
+            score = self.compute_portfolio_adjustment_batch(*values)[0]
+        if np.isnan(score):
+            # Same failure as the skfuzzy simulator when no rule fires
+            raise KeyError(self.compiled_rule_base.output_label)
+        return float(score)
+
+    def compute_portfolio_adjustment_batch(self, risk_tolerance, market_condition,
+                                           economic_indicator, portfolio_div, financial_goal,
+                                           chunk_size=8192):
+        """Scores for equal-length input arrays, NaN where no rule fires"""
+        inputs = [risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal]
+        if self.inference != 'mamdani':
+            return self.compiled_rule_base.takagi_sugeno(inputs, self.tsk_coefficients, chunk_size=chunk_size)
+        return self.compiled_rule_base.compute(inputs, chunk_size=chunk_size, defuzzify=self.defuzzify)
+
+
+def main():
+    import time
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+    from ShardedScoring import synthetic_book
+
+    path = input("Snapshot file to write (e.g. mamdani_snapshot.npz): ")
+    start = time.perf_counter()
+    model = PortfolioAdjustmentFuzzySystem(engine='compiled')
+    print(f"Built the model in {1000 * (time.perf_counter() - start):.1f} ms")
+    save_snapshot(model, path)
+
+    start = time.perf_counter()
+    snapshot = load_snapshot(path)
+    print(f"Loaded the snapshot in {1000 * (time.perf_counter() - start):.1f} ms")
+
+    book = synthetic_book(10000)
+    difference = np.abs(snapshot.compute_portfolio_adjustment_batch(*book) -
+                        model.compute_portfolio_adjustment_batch(*book))
+    print(f"Maximum difference from the built model: {np.nanmax(difference):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from Membership import strongest_term, trapezoid
+
+DIVERSIFICATION_LEVELS = ('Poor', 'Moderate', 'Good')
+# Trapezoid (a, b, c, d) of each diversification level, in the order of DIVERSIFICATION_LEVELS
+DIVERSIFICATION_LEVEL_TERMS = ((0, 0, 20, 40), (40, 50, 60, 70), (70, 80, 100, 100))
 
 
 def trapezoidal_membership(x, a, b, c, d):
@@ -8,15 +13,7 @@ def trapezoidal_membership(x, a, b, c, d):
     a, b: left foot and left shoulder of the trapezoid
     c, d: right shoulder and right foot of the trapezoid
     """
-    # Prevent division by zero
-    left_slope = (b - a) if (b - a) != 0 else 1e-6
-    right_slope = (d - c) if (d - c) != 0 else 1e-6
-
-    # Correct the np.minimum usage
-    left_condition = (x - a) / left_slope
-    right_condition = (d - x) / right_slope
-
-    return np.maximum(np.minimum(left_condition, np.minimum(1, right_condition)), 0)
+    return trapezoid(x, a, b, c, d)
 
 
 def determine_diversification_level(input_value):
@@ -38,8 +35,22 @@ def determine_diversification_level(input_value):
         return "Good", good_value
 
 
+def determine_diversification_level_batch(input_values):
+    """
+    Diversification level of every value in an array, in one argmax pass: int8
+    indices into DIVERSIFICATION_LEVELS (-1 for NaN) and their memberships
+    """
+    input_values = np.asarray(input_values, dtype=float)
+    memberships = np.empty((len(DIVERSIFICATION_LEVEL_TERMS),) + input_values.shape)
+    for index, terms in enumerate(DIVERSIFICATION_LEVEL_TERMS):
+        trapezoid(input_values, *terms, out=memberships[index, ...])
+    return strongest_term(memberships)
+
+
 def plot_fuzzy_logic(input_value):
     """Plot the fuzzy logic membership functions and highlight the input value."""
+    import matplotlib.pyplot as plt
+
     # Define the x-axis range
     x = np.linspace(0, 100, 500)
 
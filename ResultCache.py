@@ -0,0 +1,143 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def model_fingerprint(model):
+    """
+    SHA-256 over everything that decides a model's scores: every variable's
+    universe and term membership functions, the rules with their AND/OR
+    functions, the engine settings, Takagi-Sugeno coefficients and any
+    attached lookup table.
+    """
+    digest = hashlib.sha256()
+    system = model.control_system
+    for variable in list(system.antecedents) + list(system.consequents):
+        digest.update(f"{type(variable).__name__}:{variable.label}:{variable.defuzzify_method}".encode())
+        digest.update(np.ascontiguousarray(variable.universe, dtype=float).tobytes())
+        for label, term in variable.terms.items():
+            digest.update(label.encode())
+            digest.update(np.ascontiguousarray(term.mf, dtype=float).tobytes())
+
+    for rule in system.rules:
+        digest.update(str(rule).encode())
+
+    for name in ('engine', 'defuzzify', 'inference'):
+        digest.update(f"{name}={getattr(model, name, None)}".encode())
+    coefficients = getattr(model, 'tsk_coefficients', None)
+    if coefficients is not None:
+        digest.update(np.ascontiguousarray(coefficients, dtype=float).tobytes())
+    surrogate = getattr(model, 'surrogate', None)
+    if surrogate is not None:
+        digest.update(np.ascontiguousarray(surrogate.table).tobytes())
+    fuzzifier = getattr(model, 'fuzzifier', None)
+    if fuzzifier is not None:
+        for _, _, table in fuzzifier.tables:
+            digest.update(np.ascontiguousarray(table.table).tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU memo of portfolio adjustment scores. Keys are a model
+    fingerprint plus the inputs rounded to a multiple of `quantum` (None keeps
+    them exact), and a miss scores the rounded inputs, so every input that
+    maps to a key gets the same score. At most `max_entries` scores are kept.
+
+    Inputs where no rule fires raise from the model as usual and are not cached.
+    NaN and infinite inputs reach the model unrounded, so they score or raise
+    exactly as without a cache; inputs with a NaN are never cached.
+    """
+
+    def __init__(self, max_entries=4096, quantum=None):
+        if max_entries < 1:
+            raise ValueError("Cache must hold at least one entry")
+        if quantum is not None and not quantum > 0:
+            raise ValueError("Quantum must be positive or None")
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize(self, values):
+        """Inputs as a key; NaN and infinite values pass through unrounded for the model to reject"""
+        values = tuple(float(value) for value in values)
+        if self.quantum is None:
+            return values
+        return tuple(round(value / self.quantum) * self.quantum if np.isfinite(value) else value
+                     for value in values)
+
+    def get_or_compute(self, fingerprint, values, compute):
+        """Cached score for the inputs, calling compute(*inputs) on a miss"""
+        values = self.quantize(values)
+        if any(np.isnan(values)):
+            # NaN never equals itself, so such a key could never be hit again
+            return compute(*values)
+        key = (fingerprint, values)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Score outside the lock so other threads keep hitting the cache
+        score = compute(*values)
+        with self._lock:
+            self._entries[key] = score
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return score
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit, miss and eviction counts since creation"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def main():
+    import time
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    model = PortfolioAdjustmentFuzzySystem()
+    model.attach_result_cache(ResultCache(max_entries=int(input("Maximum cached scores (e.g. 4096): ")), quantum=1))
+
+    # Clients from a handful of risk profiles, scored against one day's
+    # shared market and economic readings
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    scored = 0
+    for _ in range(2000):
+        try:
+            model.compute_portfolio_adjustment(rng.choice([25, 45, 50, 65, 80]), 55, 60,
+                                               rng.choice([30, 50, 70]), rng.choice([12, 36, 60, 120]))
+            scored += 1
+        except KeyError:
+            pass
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} requests in {elapsed:.2f} s")
+    print(model.result_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
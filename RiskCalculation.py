@@ -2,6 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
+from Membership import trapezoid
 from RiskTolerance import RiskToleranceCalculator
 
 
@@ -17,13 +18,7 @@ class FuzzyRiskLogicVisualization:
         a, b: Left trapezoid base
         c, d: Right trapezoid base
         """
-        return np.maximum(
-            np.minimum(
-                np.minimum((x - a) / (b - a), 1.0),
-                (d - x) / (d - c)
-            ),
-            0.0
-        )
+        return trapezoid(x, a, b, c, d)
 
     def generate_fuzzy_plot(self, age, income, experience):
         # Calculate risk score
@@ -1,3 +1,11 @@
+import numpy as np
+
+# Client x rule pairs compared at once by calculate_risk_tolerance_batch
+PAIRS_PER_CHUNK = 1 << 18
+# Rule tables at least this large are searched through a RuleBoxIndex
+INDEX_MIN_RULES = 256
+
+
 class RiskToleranceCalculator:
     def __init__(self):
         # Define fuzzy rules
@@ -52,6 +60,77 @@ class RiskToleranceCalculator:
             }
         ]
 
+    def rule_arrays(self):
+        """
+        The rules as arrays: lower and upper bounds (rules x 3, in age, income,
+        experience order) and the risk score midpoints. Rebuilt when self.rules
+        is replaced or grows or shrinks; call refresh_rules() after editing a
+        rule in place.
+        """
+        key = (id(self.rules), len(self.rules))
+        if getattr(self, '_rule_arrays_key', None) != key:
+            dimensions = ('age_range', 'income_range', 'experience_range')
+            bounds = np.array([[rule[dimension] for dimension in dimensions] for rule in self.rules],
+                              dtype=float).reshape(len(self.rules), 3, 2)
+            # Same midpoint arithmetic as calculate_risk_tolerance
+            midpoints = np.array([sum(rule['risk_score']) / 2 for rule in self.rules], dtype=float)
+            self._rule_arrays = (bounds[:, :, 0], bounds[:, :, 1], midpoints)
+            self._rule_arrays_key = key
+        return self._rule_arrays
+
+    def rule_index(self):
+        """RuleBoxIndex over the current rule arrays, rebuilt along with them"""
+        low, high, _ = self.rule_arrays()
+        if getattr(self, '_rule_index_key', None) != self._rule_arrays_key:
+            # scipy is only imported when a large rule table needs the index
+            from RuleIndex import RuleBoxIndex
+
+            self._rule_index = RuleBoxIndex(low, high)
+            self._rule_index_key = self._rule_arrays_key
+        return self._rule_index
+
+    def refresh_rules(self):
+        """Drop the cached rule arrays and index after editing self.rules in place"""
+        self._rule_arrays_key = None
+        self._rule_index_key = None
+
+    def calculate_risk_tolerance_batch(self, age, income, experience, use_index=None):
+        """
+        calculate_risk_tolerance for equal-length arrays of clients: the first
+        rule that contains a client wins, otherwise the nearest rule by total
+        range distance (the first one on ties), otherwise 50.
+
+        use_index: search a RuleBoxIndex instead of scanning every rule;
+        by default only for tables of INDEX_MIN_RULES rules or more
+        """
+        clients = np.column_stack([np.asarray(values, dtype=float).ravel() for values in (age, income, experience)])
+        low, high, midpoints = self.rule_arrays()
+        scores = np.full(len(clients), 50.0)
+        if not len(midpoints):
+            return scores
+        if use_index is None:
+            use_index = len(midpoints) >= INDEX_MIN_RULES
+        if use_index:
+            rules, _ = self.rule_index().query(clients)
+            return np.where(rules >= 0, midpoints[rules], 50.0)
+
+        # Compare a block of clients against every rule at once
+        rows_per_chunk = max(1, PAIRS_PER_CHUNK // len(midpoints))
+        for start in range(0, len(clients), rows_per_chunk):
+            chunk = clients[start:start + rows_per_chunk, None, :]
+            contained = ((low <= chunk) & (chunk <= high)).all(axis=2)
+            distances = np.where(chunk < low, low - chunk, np.where(chunk > high, chunk - high, 0.0))
+            # Summed in the same order as the scalar version
+            total = distances[:, :, 0] + distances[:, :, 1] + distances[:, :, 2]
+            # A rule only becomes the best match with a distance below infinity (never NaN)
+            total[~(total < np.inf)] = np.inf
+            nearest = total.argmin(axis=1)
+            rows = np.arange(len(chunk))
+            best = np.where(total[rows, nearest] < np.inf, midpoints[nearest], 50.0)
+            scores[start:start + len(chunk)] = np.where(contained.any(axis=1), midpoints[contained.argmax(axis=1)],
+                                                        best)
+        return scores
+
     def _is_in_range(self, value, range_tuple):
         """Check if value is within the specified range"""
         return range_tuple[0] <= value <= range_tuple[1]
@@ -99,3 +178,27 @@ class RiskToleranceCalculator:
         elif value > max_val:
             return value - max_val
         return 0
+
+
+def main():
+    import time
+
+    clients = int(input("Synthetic clients to score (e.g. 200000): "))
+    rng = np.random.default_rng(0)
+    age = rng.integers(18, 75, clients)
+    income = rng.uniform(0, 20000, clients)
+    experience = rng.integers(0, 15, clients)
+    calculator = RiskToleranceCalculator()
+
+    start = time.perf_counter()
+    loop_scores = [calculator.calculate_risk_tolerance(*client) for client in zip(age, income, experience)]
+    loop_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    batch_scores = calculator.calculate_risk_tolerance_batch(age, income, experience)
+    batch_seconds = time.perf_counter() - start
+    print(f"Per-client loop: {loop_seconds:.2f} s, batch: {batch_seconds:.3f} s "
+          f"({loop_seconds / batch_seconds:.0f}x), identical: {np.array_equal(loop_scores, batch_scores)}")
+
+
+if __name__ == "__main__":
+    main()
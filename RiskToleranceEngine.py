@@ -0,0 +1,118 @@
+import numbers
+
+import numpy as np
+
+from FuzzySpec import load_spec
+from RiskTolerance import RiskToleranceCalculator
+
+
+class FuzzyRiskToleranceEngine:
+    """
+    Batch fuzzy inference of risk tolerance from age, monthly income and
+    investment experience.
+
+    The rule base is specs/risk_tolerance.json: the trapezoid sets plotted by
+    RiskCalculation.FuzzyRiskLogicVisualization with the six
+    RiskToleranceCalculator rules, compiled into a CompiledRuleBase like the
+    portfolio models. Scores are continuous where a rule fires; clients no
+    rule covers get the fallback, by default the crisp nearest-rule
+    RiskToleranceCalculator (a number gives a constant instead).
+    """
+
+    def __init__(self, spec='risk_tolerance', defuzzify='sampled', fallback=None):
+        if defuzzify not in ('sampled', 'analytic'):
+            raise ValueError(f"Unknown defuzzification: {defuzzify}")
+        self.spec = load_spec(spec)
+        if len(self.spec.input_labels) != 3:
+            raise ValueError(f"Spec {self.spec.name!r} needs age, income and experience inputs")
+        self.defuzzify = defuzzify
+        self.compiled_rule_base = self.spec.compile()
+        self.fallback = RiskToleranceCalculator() if fallback is None else fallback
+
+    def calculate_risk_tolerance(self, age, income, experience):
+        """Risk tolerance of one client, like RiskToleranceCalculator.calculate_risk_tolerance"""
+        return float(self.calculate_risk_tolerance_batch([age], [income], [experience])[0])
+
+    def calculate_risk_tolerance_batch(self, age, income, experience, chunk_size=8192):
+        """Risk tolerance for equal-length arrays of clients"""
+        inputs = [np.asarray(values, dtype=float).ravel() for values in (age, income, experience)]
+        scores = self.compiled_rule_base.compute(inputs, chunk_size=chunk_size, defuzzify=self.defuzzify)
+        unfired = np.isnan(scores)
+        if unfired.any():
+            if isinstance(self.fallback, numbers.Real):
+                scores[unfired] = self.fallback
+            else:
+                scores[unfired] = self.fallback.calculate_risk_tolerance_batch(
+                    *[values[unfired] for values in inputs])
+        return scores
+
+
+class FusedClientScorer:
+    """
+    Risk tolerance and portfolio adjustment for raw client records in one
+    chunked pass: each chunk's risk scores go straight into the portfolio
+    model while the chunk is still in cache, so no full-length intermediate
+    risk column is built. portfolio_model is anything with
+    compute_portfolio_adjustment_batch (a model, snapshot, registry handle or
+    ShardedScorer); it is called with the five inputs only.
+    """
+
+    def __init__(self, portfolio_model, risk_engine=None):
+        self.portfolio_model = portfolio_model
+        self.risk_engine = FuzzyRiskToleranceEngine() if risk_engine is None else risk_engine
+
+    def compute_batch(self, age, income, experience, market_condition, economic_indicator,
+                      portfolio_div, financial_goal, chunk_size=8192):
+        """(risk tolerance, portfolio adjustment) arrays; adjustment is NaN where no portfolio rule fires"""
+        inputs = [np.asarray(values, dtype=float).ravel() for values in
+                  (age, income, experience, market_condition, economic_indicator, portfolio_div, financial_goal)]
+        size = len(inputs[0])
+        if any(len(values) != size for values in inputs):
+            raise ValueError("All input arrays must have the same length")
+        risk = np.empty(size)
+        adjustment = np.empty(size)
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            chunk = [values[start:stop] for values in inputs]
+            risk[start:stop] = self.risk_engine.calculate_risk_tolerance_batch(*chunk[:3], chunk_size=chunk_size)
+            adjustment[start:stop] = self.portfolio_model.compute_portfolio_adjustment_batch(
+                risk[start:stop], *chunk[3:])
+        return risk, adjustment
+
+
+def main():
+    import time
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+    from ShardedScoring import synthetic_book
+
+    clients = int(input("Synthetic clients to score (e.g. 200000): "))
+    rng = np.random.default_rng(0)
+    age = rng.uniform(18, 70, clients)
+    income = rng.uniform(0, 16000, clients)
+    experience = rng.uniform(0, 12, clients)
+    _, market, economic, diversification, goals = synthetic_book(clients)
+
+    engine = FuzzyRiskToleranceEngine()
+    crisp = engine.fallback.calculate_risk_tolerance_batch(age, income, experience)
+    fuzzy_only = engine.compiled_rule_base.compute([age, income, experience])
+    fired = ~np.isnan(fuzzy_only)
+    print(f"Fuzzy rules fire for {fired.mean():.1%} of clients; where they do, the mean difference "
+          f"from the crisp calculator is {np.mean(np.abs(fuzzy_only[fired] - crisp[fired])):.2f}")
+
+    model = PortfolioAdjustmentFuzzySystem(engine='compiled')
+    scorer = FusedClientScorer(model, engine)
+    start = time.perf_counter()
+    risk, adjustment = scorer.compute_batch(age, income, experience, market, economic, diversification, goals)
+    fused_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    separate_risk = engine.calculate_risk_tolerance_batch(age, income, experience)
+    separate = model.compute_portfolio_adjustment_batch(separate_risk, market, economic, diversification, goals)
+    separate_seconds = time.perf_counter() - start
+    print(f"Fused: {fused_seconds:.2f} s, two separate passes: {separate_seconds:.2f} s, "
+          f"identical: {np.array_equal(adjustment, separate, equal_nan=True)}")
+
+
+if __name__ == "__main__":
+    main()
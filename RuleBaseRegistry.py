@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from FuzzySpec import load_spec, spec_path
+
+# Rule bases a scoring daemon serves by default: registry name -> spec in specs/
+DEFAULT_RULE_BASES = {
+    'mamdani-model': 'mamdani_model',
+    'mamdani-validate': 'mamdani_validate',
+    'sugeno-validate': 'sugeno_validate'
+}
+
+
+class RuleBaseVersion:
+    """
+    One compiled version of a named rule base. Versions are never modified
+    after they are built, so a request that picked one up keeps scoring on it
+    however many reloads happen meanwhile.
+    """
+
+    def __init__(self, name, spec, defuzzify, version):
+        self.name = name
+        self.spec = spec
+        self.defuzzify = defuzzify
+        self.version = version
+        self.model_version = spec.content_hash
+        self.compiled_rule_base = spec.compile()
+        self.loaded_at = time.time()
+
+    def compute_portfolio_adjustment(self, *values):
+        score = self.compiled_rule_base.compute_one(*values, defuzzify=self.defuzzify)
+        if np.isnan(score):
+            # Same failure as the skfuzzy simulator when no rule fires
+            raise KeyError(self.compiled_rule_base.output_label)
+        return score
+
+    def compute_portfolio_adjustment_batch(self, *inputs, chunk_size=8192):
+        """Scores for equal-length input arrays, NaN where no rule fires"""
+        return self.compiled_rule_base.compute(list(inputs), chunk_size=chunk_size, defuzzify=self.defuzzify)
+
+
+class RegisteredModel:
+    """
+    Model handle that scores on whatever version of a named rule base is
+    current when each call starts, so consecutive calls may score on
+    different versions. For a request made of several calls, score with
+    pin() instead; StreamScoring and ClientBook pin it themselves.
+    """
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    @property
+    def model_version(self):
+        return self.registry.get(self.name).model_version
+
+    def pin(self):
+        """Current version, to score every chunk of one request on"""
+        return self.registry.get(self.name)
+
+    def compute_portfolio_adjustment(self, *values):
+        return self.registry.get(self.name).compute_portfolio_adjustment(*values)
+
+    def compute_portfolio_adjustment_batch(self, *inputs, chunk_size=8192):
+        return self.registry.get(self.name).compute_portfolio_adjustment_batch(*inputs, chunk_size=chunk_size)
+
+
+class RuleBaseRegistry:
+    """
+    Named, hot-reloadable compiled rule bases.
+
+    Each name maps to a spec file. reload() (or the watcher thread started
+    with start(), which polls the files every poll_interval seconds) compiles
+    a changed spec off the scoring path and then swaps it in with a single
+    reference assignment: get() returns either the old or the new version,
+    never a half-built one, and requests already running finish on the
+    version they started with. A spec that fails to load or compile leaves
+    the current version serving and is reported in status().
+    """
+
+    def __init__(self, rule_bases=None, defuzzify='sampled', poll_interval=1.0):
+        if defuzzify not in ('sampled', 'analytic'):
+            raise ValueError(f"Unknown defuzzification: {defuzzify}")
+        self.defuzzify = defuzzify
+        self.poll_interval = poll_interval
+        self._versions = {}
+        self._sources = {}
+        self._errors = {}
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        for name, source in (DEFAULT_RULE_BASES if rule_bases is None else rule_bases).items():
+            self.register(name, source)
+
+    def register(self, name, source):
+        """Compile a spec name or .json path and serve it under name"""
+        path = spec_path(source)
+        with self._reload_lock:
+            self._sources[name] = (path, os.stat(path).st_mtime_ns)
+            self._versions[name] = RuleBaseVersion(name, load_spec(path), self.defuzzify, 1)
+            self._errors.pop(name, None)
+        return self._versions[name]
+
+    def names(self):
+        return list(self._versions)
+
+    def get(self, name):
+        """Current version of a rule base; hold on to it to score a whole request on one version"""
+        try:
+            return self._versions[name]
+        except KeyError:
+            raise KeyError(f"No rule base registered as {name!r}") from None
+
+    def model(self, name):
+        """Handle that always scores on the current version of name; pin() it per request"""
+        self.get(name)
+        return RegisteredModel(self, name)
+
+    def reload(self, name, force=False):
+        """
+        Re-read the spec of name and swap in a new version if its content hash
+        changed (or force is set). Returns True when a new version was swapped in.
+        """
+        with self._reload_lock:
+            path, _ = self._sources[name]
+            current = self._versions[name]
+            modified = None
+            try:
+                modified = os.stat(path).st_mtime_ns
+                spec = load_spec(path)
+                if spec.content_hash == current.model_version and not force:
+                    self._sources[name] = (path, modified)
+                    self._errors.pop(name, None)
+                    return False
+                version = RuleBaseVersion(name, spec, self.defuzzify, current.version + 1)
+            except (OSError, ValueError, KeyError, TypeError) as error:
+                self.failed_reloads += 1
+                self._errors[name] = f"{type(error).__name__}: {error}"
+                if modified is not None:
+                    # Retry when the file changes again, not on every poll
+                    self._sources[name] = (path, modified)
+                return False
+            self._sources[name] = (path, modified)
+            self._errors.pop(name, None)
+            # The swap: one reference assignment, atomic for readers
+            self._versions[name] = version
+            self.reloads += 1
+            return True
+
+    def check_for_changes(self):
+        """Reload every rule base whose spec file changed since it was last read"""
+        reloaded = []
+        for name, (path, modified) in list(self._sources.items()):
+            try:
+                changed = os.stat(path).st_mtime_ns != modified
+            except OSError:
+                changed = False
+            if changed and self.reload(name):
+                reloaded.append(name)
+        return reloaded
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check_for_changes()
+
+    def start(self):
+        """Start the background thread that reloads changed spec files"""
+        if self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name='rule-base-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def status(self):
+        """Per rule base: version number, content hash, spec file, load time and last reload error"""
+        return {name: {'version': version.version,
+                       'model_version': version.model_version,
+                       'path': self._sources[name][0],
+                       'loaded_at': version.loaded_at,
+                       'error': self._errors.get(name)}
+                for name, version in self._versions.items()}
+
+
+def main():
+    import json
+    import shutil
+    import tempfile
+
+    from ShardedScoring import synthetic_book
+
+    # Serve a copy of mamdani_validate so the demo can edit it
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'mamdani_validate.json')
+    shutil.copy(spec_path('mamdani_validate'), path)
+    registry = RuleBaseRegistry({'mamdani-validate': path}, poll_interval=0.05)
+    model = registry.model('mamdani-validate')
+    book = synthetic_book(2048)
+
+    seconds = float(input("Seconds to score for (e.g. 3): "))
+    windows = []
+    versions = []
+    with registry:
+        start = time.perf_counter()
+        edited = False
+        while time.perf_counter() - start < seconds:
+            window_start = time.perf_counter()
+            rows = 0
+            while time.perf_counter() - window_start < 0.1:
+                model.compute_portfolio_adjustment_batch(*book)
+                rows += len(book[0])
+            windows.append(rows / (time.perf_counter() - window_start))
+            versions.append(registry.get('mamdani-validate').version)
+            if not edited and time.perf_counter() - start > seconds / 2:
+                # Roll out a changed rule: the first rule now recommends rebalancing
+                with open(path) as handle:
+                    document = json.load(handle)
+                document['rules'][0]['then'] = 'rebalance'
+                with open(path + '.tmp', 'w') as handle:
+                    json.dump(document, handle)
+                os.replace(path + '.tmp', path)
+                edited = True
+    shutil.rmtree(directory)
+
+    for version in sorted(set(versions)):
+        rates = [rate for rate, served in zip(windows, versions) if served == version]
+        print(f"Version {version}: {len(rates)} windows, {min(rates):,.0f} to {max(rates):,.0f} rows/s "
+              f"(mean {np.mean(rates):,.0f})")
+    print(json.dumps(registry.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
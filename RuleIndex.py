@@ -0,0 +1,192 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Relative widening of the search radius, so rounding in the scaled
+# coordinates can never drop a rule that ties the best distance
+_RADIUS_SLACK = 1e-9
+
+
+def box_distances(points, low, high):
+    """Total distance from points to boxes, summed per dimension in order like RiskToleranceCalculator"""
+    distances = np.where(points < low, low - points, np.where(points > high, points - high, 0.0))
+    total = distances[..., 0]
+    for dimension in range(1, distances.shape[-1]):
+        total = total + distances[..., dimension]
+    return total
+
+
+class RuleBoxIndex:
+    """
+    Index over the rule hyper-rectangles of a RiskToleranceCalculator.
+
+    A rule at distance r from a client has its centre within half-size + r of
+    the client in every dimension. Rules are grouped by their per-dimension
+    half-sizes (powers of two), and each group keeps a KD-tree of its centres
+    scaled by the group's largest half-sizes, where that condition becomes a
+    max-norm ball of radius 1 + r / (smallest half-size). The rules with the
+    nearest scaled centres give a bound r on the best distance, a ball query
+    per group returns every rule that can match it, and only those
+    candidates are measured exactly.
+
+    query() returns the rule a linear scan picks: the lowest-index rule at
+    the smallest distance, which is the first containing rule whenever one
+    contains the client (distance 0).
+    """
+
+    def __init__(self, low, high, neighbours=4):
+        self.low = np.asarray(low, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        if self.low.shape != self.high.shape or self.low.ndim != 2:
+            raise ValueError("Rule bounds must be two (rules x dimensions) arrays")
+        self.neighbours = neighbours
+        centres = (self.low + self.high) / 2
+        # Zero-width ranges get a tiny half-size so scaling stays finite; a
+        # larger half-size only widens the search
+        spread = np.ptp(centres, axis=0) if len(centres) else np.ones(self.low.shape[1])
+        half_sizes = np.maximum((self.high - self.low) / 2, 1e-9 * np.maximum(spread, 1.0))
+        groups = np.floor(np.log2(half_sizes)).astype(int)
+        self.groups = []
+        for group in np.unique(groups, axis=0):
+            rules = np.flatnonzero((groups == group).all(axis=1))
+            scale = half_sizes[rules].max(axis=0)
+            self.groups.append((cKDTree(centres[rules] / scale), rules, scale))
+
+    @classmethod
+    def from_calculator(cls, calculator, neighbours=4):
+        low, high, _ = calculator.rule_arrays()
+        return cls(low, high, neighbours)
+
+    def __len__(self):
+        return len(self.low)
+
+    def query(self, points):
+        """
+        (rule index, distance) for each row of a (clients x dimensions) array.
+        The index is -1 where no rule is at a finite distance; rows with
+        non-finite values are scanned linearly so they match the scan exactly.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        size = len(points)
+        best_rules = np.full(size, -1, dtype=np.intp)
+        best_distances = np.full(size, np.inf)
+        if not len(self) or not size:
+            return best_rules, best_distances
+
+        finite = np.isfinite(points).all(axis=1)
+        if not finite.all():
+            rows = np.flatnonzero(~finite)
+            best_rules[rows], best_distances[rows] = self._scan(points[rows])
+        rows = np.flatnonzero(finite)
+        if rows.size:
+            best_rules[rows], best_distances[rows] = self._search(points[rows])
+        return best_rules, best_distances
+
+    def _scan(self, points):
+        total = box_distances(points[:, None, :], self.low, self.high)
+        total[~(total < np.inf)] = np.inf
+        nearest = total.argmin(axis=1)
+        distance = total[np.arange(len(points)), nearest]
+        return np.where(distance < np.inf, nearest, -1), distance
+
+    def _search(self, points):
+        # Upper bound: exact distance to the rules with the nearest scaled centres
+        bound = np.full(len(points), np.inf)
+        for tree, rules, scale in self.groups:
+            k = min(self.neighbours, len(rules))
+            _, nearest = tree.query(points / scale, k=k, p=np.inf)
+            candidates = rules[nearest.reshape(len(points), k)]
+            distances = box_distances(points[:, None, :], self.low[candidates], self.high[candidates])
+            bound = np.minimum(bound, distances.min(axis=1))
+
+        # Every rule that can be as close as the bound, measured exactly
+        row_ids, rule_ids = [], []
+        for tree, rules, scale in self.groups:
+            radius = (1 + bound / scale.min()) * (1 + _RADIUS_SLACK)
+            matches = tree.query_ball_point(points / scale, radius, p=np.inf)
+            lengths = np.fromiter((len(match) for match in matches), dtype=np.intp, count=len(matches))
+            if lengths.sum():
+                row_ids.append(np.repeat(np.arange(len(points)), lengths))
+                rule_ids.append(rules[np.concatenate([match for match in matches if match]).astype(np.intp)])
+        row_ids, rule_ids = np.concatenate(row_ids), np.concatenate(rule_ids)
+        distances = box_distances(points[row_ids], self.low[rule_ids], self.high[rule_ids])
+
+        # Per client: smallest distance, then lowest rule index
+        order = np.lexsort((rule_ids, distances, row_ids))
+        first = order[np.r_[True, row_ids[order][1:] != row_ids[order][:-1]]]
+        best_rules = np.full(len(points), -1, dtype=np.intp)
+        best_distances = np.full(len(points), np.inf)
+        best_rules[row_ids[first]] = rule_ids[first]
+        best_distances[row_ids[first]] = distances[first]
+        return best_rules, best_distances
+
+
+def random_rules(count, seed=0):
+    """Calibration-style rule table: random age, income and experience ranges and risk scores"""
+    rng = np.random.default_rng(seed)
+    rules = []
+    for _ in range(count):
+        age = rng.uniform(18, 70)
+        income = rng.uniform(0, 20000)
+        experience = rng.uniform(0, 15)
+        score = rng.uniform(0, 80)
+        rules.append({
+            'age_range': (age, age + rng.uniform(2, 15)),
+            'income_range': (income, income + rng.uniform(500, 5000)),
+            'experience_range': (experience, experience + rng.uniform(1, 5)),
+            'risk_level': 'calibrated',
+            'risk_score': (score, score + 20)
+        })
+    return rules
+
+
+def benchmark(rule_counts=(10, 1000, 100000), clients=2000, seed=0):
+    """Seconds per client for the scalar scan, the vectorized scan and the index, per rule count"""
+    import time
+
+    from RiskTolerance import RiskToleranceCalculator
+
+    rng = np.random.default_rng(seed + 1)
+    age = rng.uniform(18, 80, clients)
+    income = rng.uniform(0, 25000, clients)
+    experience = rng.uniform(0, 20, clients)
+    results = []
+    for count in rule_counts:
+        calculator = RiskToleranceCalculator()
+        calculator.rules = random_rules(count, seed)
+
+        # The scalar scan is slow on big tables, so time it on a sample
+        sample = max(1, min(clients, 200000 // count))
+        start = time.perf_counter()
+        scalar = [calculator.calculate_risk_tolerance(*client)
+                  for client in zip(age[:sample], income[:sample], experience[:sample])]
+        scalar_seconds = (time.perf_counter() - start) / sample
+
+        start = time.perf_counter()
+        scanned = calculator.calculate_risk_tolerance_batch(age, income, experience, use_index=False)
+        scan_seconds = (time.perf_counter() - start) / clients
+
+        start = time.perf_counter()
+        index = RuleBoxIndex.from_calculator(calculator)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        rules, _ = index.query(np.column_stack([age, income, experience]))
+        indexed = np.where(rules >= 0, calculator.rule_arrays()[2][rules], 50.0)
+        index_seconds = (time.perf_counter() - start) / clients
+
+        results.append({'rules': count, 'scalar': scalar_seconds, 'scan': scan_seconds,
+                        'index': index_seconds, 'build': build_seconds,
+                        'identical': bool(np.array_equal(indexed, scanned) and
+                                          np.array_equal(scalar, scanned[:sample]))})
+    return results
+
+
+def main():
+    clients = int(input("Clients to query per rule table (e.g. 2000): "))
+    print(f"{'rules':>8} {'scalar scan':>14} {'vector scan':>14} {'index':>14} {'index build':>12}  identical")
+    for result in benchmark(clients=clients):
+        print(f"{result['rules']:>8} {1e6 * result['scalar']:>11.1f} us {1e6 * result['scan']:>11.1f} us "
+              f"{1e6 * result['index']:>11.1f} us {result['build']:>10.3f} s  {result['identical']}")
+
+
+if __name__ == "__main__":
+    main()
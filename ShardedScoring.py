@@ -0,0 +1,261 @@
+import os
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from ResultCache import model_fingerprint
+
+# Model built once per worker process by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_class, model_kwargs):
+    global _worker_model
+    _worker_model = model_class(**model_kwargs)
+
+
+def _score_chunk(inputs):
+    return _worker_model.compute_portfolio_adjustment_batch(*inputs)
+
+
+def _score_shared_slice(name, rows, start, stop):
+    """Score rows start:stop of a SharedBook in place"""
+    # Pool workers share the parent's resource tracker (see ShardedScorer),
+    # so attaching here does not tie the block's lifetime to this process
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        columns = np.ndarray((6, rows), dtype=np.float64, buffer=block.buf)
+        columns[5, start:stop] = _worker_model.compute_portfolio_adjustment_batch(*columns[:5, start:stop])
+        del columns
+    finally:
+        block.close()
+
+
+def _release_block(block):
+    try:
+        block.close()
+    except BufferError:
+        # Views handed out are still alive; the mapping goes when they do
+        pass
+    block.unlink()
+
+
+class SharedBook:
+    """
+    Client book held in one multiprocessing.shared_memory block: the five
+    input columns followed by the score column, so pool workers attach to
+    their slice and write scores in place instead of pickling arrays.
+
+    Fill `inputs` directly to avoid any copy. The block is unlinked by close(),
+    on leaving a with-block, or when the book is garbage collected.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._block = shared_memory.SharedMemory(create=True, size=max(1, 6 * rows * 8))
+        self._finalizer = weakref.finalize(self, _release_block, self._block)
+        self.name = self._block.name
+        self.columns = np.ndarray((6, rows), dtype=np.float64, buffer=self._block.buf)
+        self.inputs = list(self.columns[:5])
+        self.scores = self.columns[5]
+
+    @classmethod
+    def from_arrays(cls, *inputs):
+        """Copy five equal-length input arrays into a new shared book"""
+        book = cls(len(inputs[0]))
+        for column, values in zip(book.inputs, inputs):
+            column[:] = values
+        return book
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.inputs = self.scores = self.columns = None
+        self._finalizer()
+
+
+class ShardedScorer:
+    """
+    Scores large batches with compute_portfolio_adjustment_batch across a
+    process pool. Every worker builds model_class(**model_kwargs) once when it
+    starts; a batch is cut into chunk_size-row shards that are scored in
+    parallel and reassembled in input order. workers=1 scores in-process.
+
+    With shared=True batches go through a SharedBook instead of being pickled
+    to the workers; score_shared() scores a book the caller filled directly.
+
+    model_version is the fingerprint of model_class(**model_kwargs), the
+    model every worker scores with.
+
+    Use it as a context manager, or call close(), to shut the workers down.
+    """
+
+    def __init__(self, model_class, workers=None, chunk_size=262144, model_kwargs=None, shared=False):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1")
+        self.model_class = model_class
+        self.model_kwargs = model_kwargs or {}
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.shared = shared
+        if shared:
+            # Workers must inherit this process's resource tracker; one of their
+            # own would report the parent's blocks as leaked when they exit
+            resource_tracker.ensure_running()
+        if self.workers == 1:
+            # Kept on the scorer, not in _worker_model, so scorers in one process stay independent
+            self._model = model_class(**self.model_kwargs)
+            self._executor = None
+        else:
+            self._model = None
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(model_class, self.model_kwargs))
+        model = self._model if self._model is not None else model_class(**self.model_kwargs)
+        self.model_version = getattr(model, 'model_version', None) or model_fingerprint(model)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def warm_up(self):
+        """Start the workers and build their models ahead of the first batch"""
+        if self._executor is not None:
+            probe = [np.zeros(1)] * 5
+            list(self._executor.map(_score_chunk, [probe] * self.workers))
+
+    def compute_portfolio_adjustment_batch(self, risk_tolerance, market_condition,
+                                           economic_indicator, portfolio_div, financial_goal):
+        """Same scores as the model's compute_portfolio_adjustment_batch, NaN where no rule fires"""
+        inputs = [np.asarray(values, dtype=float).ravel() for values in
+                  (risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal)]
+        size = len(inputs[0])
+        if any(len(values) != size for values in inputs):
+            raise ValueError("All input arrays must have the same length")
+
+        if self.shared:
+            with SharedBook.from_arrays(*inputs) as book:
+                return self.score_shared(book).copy()
+
+        shards = ([values[start:start + self.chunk_size] for values in inputs]
+                  for start in range(0, size, self.chunk_size))
+        if self._executor is None:
+            scores = [self._model.compute_portfolio_adjustment_batch(*shard) for shard in shards]
+        else:
+            # map() yields results in submission order, whichever worker finishes first
+            scores = list(self._executor.map(_score_chunk, shards))
+        return np.concatenate(scores) if scores else np.empty(0)
+
+    def score_shared(self, book):
+        """Fill book.scores in place, one task per chunk_size rows, and return it"""
+        starts = range(0, book.rows, self.chunk_size)
+        stops = [min(start + self.chunk_size, book.rows) for start in starts]
+        if self._executor is None:
+            book.scores[:] = self._model.compute_portfolio_adjustment_batch(*book.inputs)
+        else:
+            # Only the block name and row range are pickled; list() re-raises worker errors
+            list(self._executor.map(_score_shared_slice, [book.name] * len(stops), [book.rows] * len(stops),
+                                    starts, stops))
+        return book.scores
+
+
+def synthetic_book(rows, seed=0):
+    """Random client inputs spanning every input universe"""
+    rng = np.random.default_rng(seed)
+    return [rng.uniform(0, 100, rows), rng.uniform(0, 100, rows), rng.uniform(0, 100, rows),
+            rng.uniform(0, 100, rows), rng.uniform(0, 120, rows)]
+
+
+def scaling_benchmark(rows, chunk_size):
+    """Throughput on a synthetic book at 1, 2, 4, ... workers up to every core"""
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    book = synthetic_book(rows)
+    counts, workers = [], 1
+    while workers < os.cpu_count():
+        counts.append(workers)
+        workers *= 2
+    counts.append(os.cpu_count())
+
+    baseline, reference = None, None
+    for workers in counts:
+        with ShardedScorer(PortfolioAdjustmentFuzzySystem, workers=workers, chunk_size=chunk_size) as scorer:
+            scorer.warm_up()
+            start = time.perf_counter()
+            scores = scorer.compute_portfolio_adjustment_batch(*book)
+            elapsed = time.perf_counter() - start
+
+        if baseline is None:
+            baseline, reference = elapsed, scores
+        elif not np.array_equal(scores, reference, equal_nan=True):
+            raise AssertionError(f"Scores with {workers} workers differ from a single worker")
+        speedup = baseline / elapsed
+        print(f"{workers:>3} workers: {elapsed:8.2f} s, {rows / elapsed:12.0f} rows/s, "
+              f"speedup {speedup:5.2f}x, efficiency {speedup / workers:5.1%}")
+
+
+def transport_benchmark(row_counts, chunk_size, workers=None):
+    """
+    Pickled shards against shared memory, both when the batch is copied into
+    a SharedBook and when the book is filled in shared memory to begin with
+    """
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    # At least two workers, since a single one scores in-process with nothing to transport
+    workers = workers or max(2, os.cpu_count())
+    with ShardedScorer(PortfolioAdjustmentFuzzySystem, workers=workers, chunk_size=chunk_size) as pickled, \
+            ShardedScorer(PortfolioAdjustmentFuzzySystem, workers=workers, chunk_size=chunk_size,
+                          shared=True) as shared:
+        pickled.warm_up()
+        shared.warm_up()
+        for rows in row_counts:
+            book = synthetic_book(rows)
+            start = time.perf_counter()
+            reference = pickled.compute_portfolio_adjustment_batch(*book)
+            pickled_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            copied = shared.compute_portfolio_adjustment_batch(*book)
+            copied_time = time.perf_counter() - start
+
+            with SharedBook(rows) as shared_book:
+                for column, values in zip(shared_book.inputs, book):
+                    column[:] = values
+                del book
+                start = time.perf_counter()
+                in_place = shared.score_shared(shared_book)
+                in_place_time = time.perf_counter() - start
+                matches = (np.array_equal(in_place, reference, equal_nan=True) and
+                           np.array_equal(copied, reference, equal_nan=True))
+                del in_place
+            if not matches:
+                raise AssertionError("Shared-memory scores differ from the pickled ones")
+            print(f"{rows:>10} rows: pickled {pickled_time:8.2f} s, shared with copy {copied_time:8.2f} s, "
+                  f"shared in place {in_place_time:8.2f} s")
+
+
+def main():
+    choice = input("Benchmark worker scaling or pickled vs shared-memory transport? (scaling/transport): ")
+    chunk_size = int(input("Rows per shard (e.g. 262144): "))
+    if choice.strip().lower() == 'transport':
+        row_counts = input("Book sizes (e.g. 1000000,10000000,50000000): ")
+        transport_benchmark([int(rows) for rows in row_counts.split(',')], chunk_size)
+    else:
+        scaling_benchmark(int(input("Rows in the synthetic book (e.g. 10000000): ")), chunk_size)
+
+
+if __name__ == "__main__":
+    main()
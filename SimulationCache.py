@@ -0,0 +1,151 @@
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import Headless  # noqa: F401 - keeps skfuzzy.control from importing matplotlib.pyplot
+from skfuzzy import control as ctrl
+
+SIMULATION_CACHE_MODES = ('off', 'lru', 'flush')
+
+
+def state_stores(control_system):
+    """
+    Every per-simulation state store skfuzzy keeps for a ControlSystem: inputs,
+    outputs, term memberships and cuts, rule firings and consequent activations.
+    Each maps a simulation's unique_id (control system plus inputs) to a value.
+    """
+    stores = []
+    for antecedent in control_system.antecedents:
+        stores.append(antecedent.input)
+        for term in antecedent.terms.values():
+            stores.extend([term.membership_value, term.cuts])
+    for consequent in control_system.consequents:
+        stores.append(consequent.output)
+        for term in consequent.terms.values():
+            stores.extend([term.membership_value, term.cuts])
+    for rule in control_system.rules:
+        stores.append(rule.aggregate_firing)
+        stores.extend(weighted.activation for weighted in rule.consequent)
+    return stores
+
+
+def _value_bytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_value_bytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def simulation_footprint(simulation):
+    """
+    Memory held for a simulation's ControlSystem: distinct inputs with cached
+    state, stored values and an estimate of their size in bytes. State is
+    shared by every simulation over the same ControlSystem.
+    """
+    cached_inputs, entries, state_bytes = set(), 0, 0
+    for store in state_stores(simulation.ctrl):
+        state_bytes += sys.getsizeof(store._sim_data)
+        for key, value in store._sim_data.items():
+            if key == 'current':
+                continue
+            cached_inputs.add(key)
+            entries += 1
+            state_bytes += _value_bytes(value)
+    return {
+        'cached_inputs': len(cached_inputs),
+        'recorded_runs': len(simulation._calculated),
+        'state_entries': entries,
+        'state_bytes': state_bytes
+    }
+
+
+class _RecentInputs(OrderedDict):
+    """Insertion-ordered stand-in for skfuzzy's list of calculated input ids"""
+
+    def append(self, unique_id):
+        self[unique_id] = None
+
+
+class LRUSimulation(ctrl.ControlSystemSimulation):
+    """
+    ControlSystemSimulation whose result cache keeps the state of at most
+    `max_entries` distinct inputs and drops the least recently used one past
+    that, instead of skfuzzy's choice between caching nothing and clearing
+    everything every flush_after_run runs.
+    """
+
+    def __init__(self, control_system, max_entries=1000, **kwargs):
+        if max_entries < 1:
+            raise ValueError("Cache must hold at least one input")
+        self._partial_ids = set()
+        super().__init__(control_system, cache=True, flush_after_run=float('inf'), **kwargs)
+        self.max_entries = max_entries
+        self._stores = state_stores(control_system)
+        self._calculated = _RecentInputs()
+
+    def _update_unique_id(self):
+        super()._update_unique_id()
+        # Inputs set one at a time leave state under the id of every partial
+        # input combination; remember them so compute() can drop the unused ones
+        self._partial_ids.add(self.unique_id)
+
+    def _drop(self, unique_id):
+        for store in self._stores:
+            store._sim_data.pop(unique_id, None)
+
+    def compute(self):
+        for unique_id in self._partial_ids:
+            if unique_id != self.unique_id and unique_id not in self._calculated:
+                self._drop(unique_id)
+        self._partial_ids = set()
+
+        if self.unique_id in self._calculated:
+            self._calculated.move_to_end(self.unique_id)
+        super().compute()
+        while len(self._calculated) > self.max_entries:
+            evicted, _ = self._calculated.popitem(last=False)
+            self._drop(evicted)
+
+    def _reset_simulation(self):
+        super()._reset_simulation()
+        self._calculated = _RecentInputs()
+
+
+def build_simulation(control_system, mode='flush', size=1000):
+    """
+    Simulation over control_system with the given result cache:
+    'off' keeps nothing between runs, 'lru' keeps the last `size` distinct
+    inputs, 'flush' is skfuzzy's default of clearing everything every `size` runs
+    """
+    if mode == 'off':
+        return ctrl.ControlSystemSimulation(control_system, cache=False)
+    if mode == 'lru':
+        return LRUSimulation(control_system, max_entries=size)
+    if mode == 'flush':
+        return ctrl.ControlSystemSimulation(control_system, flush_after_run=size)
+    raise ValueError(f"Unknown simulation cache mode: {mode}")
+
+
+def main():
+    import time
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    runs = int(input("Distinct inputs to score per mode (e.g. 3000): "))
+    rng = np.random.default_rng(0)
+    inputs = np.column_stack([rng.uniform(0, 100, (runs, 4)), rng.uniform(0, 120, runs)])
+    for mode in SIMULATION_CACHE_MODES:
+        model = PortfolioAdjustmentFuzzySystem(simulation_cache=mode, simulation_cache_size=500)
+        start = time.perf_counter()
+        for row in inputs:
+            try:
+                model.compute_portfolio_adjustment(*row)
+            except KeyError:
+                pass
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>5}: {elapsed:.2f} s, {model.simulation_footprint()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import numpy as np
+import Headless  # noqa: F401 - keeps skfuzzy.control from importing matplotlib.pyplot
+from skfuzzy import control as ctrl
+from skfuzzy.control.controlsystem import CrispValueCalculator, _InputAcceptor
+from skfuzzy.control.exceptions import EmptyMembershipError, NoTermMembershipsError
+from skfuzzy.fuzzymath.fuzzy_ops import _interp_universe_fast, interp_membership
+
+from ResultCache import model_fingerprint
+
+
+class _PooledInputs(_InputAcceptor):
+    """
+    Input acceptor that keeps crisp inputs on its own simulation. skfuzzy's
+    version stages every input in the Antecedents' single 'current' slot,
+    which all simulations of a ControlSystem share.
+    """
+
+    def __init__(self, simulation):
+        super().__init__(simulation)
+        self.antecedents = OrderedDict((antecedent.label, antecedent) for antecedent in simulation.ctrl.antecedents)
+        self.values = OrderedDict((label, None) for label in self.antecedents)
+
+    def __setitem__(self, key, value):
+        if key not in self.antecedents:
+            raise ValueError("Unexpected input: " + key)
+        universe = self.antecedents[key].universe
+        self.values[key] = float(np.clip(value, universe.min(), universe.max()))
+        self.sim._update_unique_id()
+
+    def _update_to_current(self):
+        for label, antecedent in self.antecedents.items():
+            antecedent.input[self.sim] = self.values[label]
+
+    def _get_inputs(self):
+        return OrderedDict(self.values)
+
+
+class _PooledCalculator(CrispValueCalculator):
+    """
+    CrispValueCalculator.find_memberships with the activation cuts held in a
+    local dict; skfuzzy parks them on the shared Term objects between its two
+    passes over the terms.
+    """
+
+    def find_memberships(self):
+        cuts = OrderedDict()
+        new_values = []
+        for label, term in self.var.terms.items():
+            cut = term.membership_value[self.sim]
+            if cut is None:
+                continue
+            cuts[label] = cut
+            new_values.extend(_interp_universe_fast(self.var.universe, term.mf, cut).tolist())
+
+        new_universe = np.union1d(self.var.universe, new_values)
+        output_mf = np.zeros_like(new_universe, dtype=np.float64)
+        term_mfs = {}
+        for label, cut in cuts.items():
+            upsampled_mf = interp_membership(self.var.universe, self.var.terms[label].mf, new_universe)
+            term_mfs[label] = np.minimum(cut, upsampled_mf)
+            np.maximum(output_mf, term_mfs[label], out=output_mf)
+        return new_universe, output_mf, term_mfs
+
+
+class PooledSimulation(ctrl.ControlSystemSimulation):
+    """
+    ControlSystemSimulation that can run alongside others over the same
+    ControlSystem. skfuzzy keeps per-run state on the shared Term and Rule
+    objects keyed by the control system and inputs, so the key here also
+    includes the simulation's own id, inputs never go through the shared
+    'current' slot and defuzzification keeps its cuts local.
+    """
+
+    def __init__(self, control_system, **kwargs):
+        super().__init__(control_system, **kwargs)
+        self.input = _PooledInputs(self)
+        self._update_unique_id()
+
+    def _update_unique_id(self):
+        super()._update_unique_id()
+        self.unique_id = f"{id(self)}:{self.unique_id}"
+
+    def defuzz_consequents(self):
+        results = {}
+        for consequent in self.ctrl.consequents:
+            try:
+                consequent.output[self] = _PooledCalculator(consequent, self).defuzz()
+            except (NoTermMembershipsError, EmptyMembershipError):
+                continue
+            results[consequent.label] = consequent.output[self]
+        return results
+
+
+class SimulatorPool:
+    """
+    Thread-safe scoring facade holding `size` pre-built simulations over the
+    model's single ControlSystem. Each request checks one out, scores and
+    returns it, so threads never share simulator inputs and nothing is rebuilt.
+    Waiting threads get simulations in the order they asked for them; a
+    thread returning one cannot take it straight back ahead of them.
+
+    skfuzzy's reset clears every simulation's state on the shared Terms, so
+    instead of letting each simulation flush on its own, the pool flushes all
+    of them together every `flush_every` runs: it stops handing simulations
+    out, and the check-in that leaves none in use resets them all. Waiting
+    checkouts keep their timeouts meanwhile.
+    While a pool is in use, score that model only through the pool: the
+    model's own simulator shares the ControlSystem and would clear the pool's
+    state when it flushes.
+    """
+
+    def __init__(self, model, size=4, flush_every=1000, result_cache=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.model = model
+        self.size = size
+        self.flush_every = flush_every
+        self.input_labels = model.compiled_rule_base.input_labels
+        self.output_label = model.compiled_rule_base.output_label
+        # Optional ResultCache consulted before checking out a simulation
+        self.result_cache = result_cache
+        self.fingerprint = model_fingerprint(model) if result_cache is not None else None
+
+        # Flushing is left to the pool, see _checkin()
+        self._available = [PooledSimulation(model.control_system, flush_after_run=float('inf'))
+                           for _ in range(size)]
+        # One ticket per waiting checkout, oldest first; only the oldest may take a simulation
+        self._waiters = deque()
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._runs_since_flush = 0
+        self._flush_due = False
+        self._checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._in_use = 0
+
+    @contextmanager
+    def simulator(self, timeout=None):
+        """Check out a simulation for the duration of the with-block"""
+        simulation = self._checkout(timeout)
+        try:
+            yield simulation
+        finally:
+            self._checkin(simulation)
+
+    def _checkout(self, timeout):
+        start = time.perf_counter()
+        ticket = object()
+        with self._condition:
+            self._waiters.append(ticket)
+            try:
+                while self._flush_due or not self._available or self._waiters[0] is not ticket:
+                    remaining = None if timeout is None else start + timeout - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No simulator available within {timeout} seconds")
+                    self._condition.wait(remaining)
+            except BaseException:
+                # Let the next waiter move up if this one was at the head
+                self._waiters.remove(ticket)
+                self._condition.notify_all()
+                raise
+            self._waiters.popleft()
+            simulation = self._available.pop()
+            waited = time.perf_counter() - start
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._in_use += 1
+            if self._available and self._waiters:
+                self._condition.notify_all()
+        return simulation
+
+    def _checkin(self, simulation):
+        with self._condition:
+            self._in_use -= 1
+            self._available.append(simulation)
+            if self._flush_due and self._in_use == 0:
+                for pooled in self._available:
+                    pooled.reset()
+                self._runs_since_flush = 0
+                self._flush_due = False
+            self._condition.notify_all()
+
+    def compute_portfolio_adjustment(self, risk_tolerance, market_condition,
+                                     economic_indicator, portfolio_div, financial_goal, timeout=None):
+        """Same result as model.compute_portfolio_adjustment with the skfuzzy engine"""
+        values = (risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal)
+        if self.result_cache is not None:
+            return self.result_cache.get_or_compute(self.fingerprint, values,
+                                                    lambda *quantized: self._score(quantized, timeout))
+        return self._score(values, timeout)
+
+    def _score(self, values, timeout):
+        with self.simulator(timeout) as simulation:
+            for label, value in zip(self.input_labels, values):
+                simulation.input[label] = value
+            # A cache hit only copies outputs that exist, so clear the previous
+            # run's score; otherwise repeated no-rule-fired inputs return it
+            simulation.output = {}
+            # Counted while the simulation is still checked out, so a check-in always follows a due flush
+            with self._lock:
+                self._runs_since_flush += 1
+                if self._runs_since_flush >= self.flush_every:
+                    self._flush_due = True
+            simulation.compute()
+            score = simulation.output[self.output_label]
+        return score
+
+    def metrics(self):
+        """Checkout count and wait times in seconds"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'checkouts': self._checkouts,
+                'total_wait': self._total_wait,
+                'mean_wait': self._total_wait / self._checkouts if self._checkouts else 0.0,
+                'max_wait': self._max_wait
+            }
+
+
+def main():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    threads = int(input("Scoring threads (e.g. 4): "))
+    pool = SimulatorPool(PortfolioAdjustmentFuzzySystem(), size=threads)
+    rng = np.random.default_rng(0)
+    clients = [(*rng.uniform(0, 100, 4), rng.uniform(0, 120)) for _ in range(200)]
+
+    def score(client):
+        try:
+            return pool.compute_portfolio_adjustment(*client)
+        except KeyError:
+            return float('nan')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        scores = list(executor.map(score, clients))
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(scores)} clients in {elapsed:.2f} s")
+    print(pool.metrics())
+
+
+if __name__ == "__main__":
+    main()
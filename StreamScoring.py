@@ -0,0 +1,109 @@
+import csv
+import itertools
+import os
+
+import numpy as np
+
+# Same cut-offs as MamdaniModel.main and FuzzyAPP.main: below 40 diversify,
+# below 70 rebalance, otherwise hold
+RECOMMENDATION_THRESHOLDS = (40, 70)
+RECOMMENDATIONS = ("Diversify Portfolio", "Rebalance Portfolio", "Hold Current Portfolio")
+# Code and label for rows where no rule fires (compute_portfolio_adjustment raises KeyError)
+NO_RECOMMENDATION = -1
+NO_RECOMMENDATION_LABEL = "No Rule Fired"
+
+INPUT_COLUMNS = ('risk_tolerance', 'market_conditions', 'economic_indicators',
+                 'portfolio_diversification', 'financial_goals')
+
+
+def recommendation_codes(scores):
+    """Index into RECOMMENDATIONS for every score, NO_RECOMMENDATION for NaN"""
+    scores = np.asarray(scores, dtype=float)
+    codes = np.searchsorted(RECOMMENDATION_THRESHOLDS, scores, side='right').astype(np.int8)
+    codes[np.isnan(scores)] = NO_RECOMMENDATION
+    return codes
+
+
+def iter_csv_chunks(path, chunk_size=65536, columns=INPUT_COLUMNS):
+    """Yield (rows x 5) float arrays from a CSV file with a header naming the input columns"""
+    with open(path, newline='') as handle:
+        reader = csv.reader(handle)
+        header = [name.strip() for name in next(reader)]
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise ValueError(f"{path} has no column(s) {missing}")
+        positions = [header.index(name) for name in columns]
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                return
+            yield np.array([[row[position] for position in positions] for row in rows], dtype=float)
+
+
+def iter_array_chunks(array, chunk_size=65536):
+    """Yield (rows x 5) float chunks of an array, np.memmap or .npy path (opened memory-mapped)"""
+    if isinstance(array, (str, os.PathLike)):
+        array = np.load(array, mmap_mode='r')
+    if array.ndim != 2 or array.shape[1] != len(INPUT_COLUMNS):
+        raise ValueError(f"Expected a (rows x {len(INPUT_COLUMNS)}) array, got shape {array.shape}")
+    for start in range(0, len(array), chunk_size):
+        yield np.asarray(array[start:start + chunk_size], dtype=float)
+
+
+def iter_input_chunks(source, chunk_size=65536):
+    """Chunks of a .csv or .npy path, or of an in-memory/memory-mapped array"""
+    if isinstance(source, (str, os.PathLike)) and os.fspath(source).lower().endswith('.csv'):
+        return iter_csv_chunks(source, chunk_size)
+    return iter_array_chunks(source, chunk_size)
+
+
+def score_stream(model, source, output_path, chunk_size=65536):
+    """
+    Score every row of source chunk by chunk with the model's (or a
+    ShardedScorer's) compute_portfolio_adjustment_batch and append score,
+    recommendation code and recommendation to a CSV as each chunk finishes.
+    Only one chunk is held in memory, whatever the size of the input. A
+    RegisteredModel is pinned first, so a reload mid-stream does not mix
+    versions.
+
+    Returns the number of rows and the count of each recommendation.
+    """
+    if hasattr(model, 'pin'):
+        model = model.pin()
+    counts = {label: 0 for label in RECOMMENDATIONS + (NO_RECOMMENDATION_LABEL,)}
+    labels = np.array(RECOMMENDATIONS + (NO_RECOMMENDATION_LABEL,))
+    rows = 0
+    with open(output_path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['score', 'recommendation_code', 'recommendation'])
+        for chunk in iter_input_chunks(source, chunk_size):
+            scores = model.compute_portfolio_adjustment_batch(*chunk.T)
+            codes = recommendation_codes(scores)
+            # Code -1 picks the last label, NO_RECOMMENDATION_LABEL
+            chunk_labels = labels[codes]
+            writer.writerows(zip(np.char.mod('%.6f', scores), codes.tolist(), chunk_labels.tolist()))
+            rows += len(chunk)
+            for code, count in zip(*np.unique(codes, return_counts=True)):
+                counts[labels[code]] += int(count)
+    return {'rows': rows, 'recommendations': counts}
+
+
+def main():
+    import time
+
+    from MamdaniValidate import PortfolioAdjustmentFuzzySystem
+
+    source = input("Client file to score (.csv with input columns, or a rows x 5 .npy): ")
+    output_path = input("Output CSV for scores and recommendations: ")
+    chunk_size = int(input("Rows per chunk (e.g. 65536): "))
+
+    start = time.perf_counter()
+    summary = score_stream(PortfolioAdjustmentFuzzySystem(), source, output_path, chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {summary['rows']} clients in {elapsed:.2f} s")
+    for label, count in summary['recommendations'].items():
+        print(f"  {label}: {count}")
+
+
+if __name__ == "__main__":
+    main()
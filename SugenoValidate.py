@@ -1,154 +1,103 @@
 import numpy as np
 import skfuzzy as fuzz
-from skfuzzy import control as ctrl
-import matplotlib.pyplot as plt
 
 from FinancialGoal import InvestmentHorizonFuzzy
 from MarketCondition import MarketConditionFuzzy
 from PortfolioDiv import determine_diversification_level
 from EconomicIndicator import EconomicIndicatorFuzzy
+from CompiledRuleBase import CompiledRuleBase
+from ResultCache import model_fingerprint
+from FuzzySpec import load_spec
+from SimulationCache import SIMULATION_CACHE_MODES, build_simulation, simulation_footprint
+from StreamScoring import INPUT_COLUMNS
 
 
 class PortfolioAdjustmentFuzzySugeno:
-    def __init__(self):
-        # Input variables
-        self.risk_tolerance = ctrl.Antecedent(np.linspace(0, 100, 200), 'risk_tolerance')
-        self.market_conditions = ctrl.Antecedent(np.linspace(0, 100, 200), 'market_conditions')
-        self.economic_indicators = ctrl.Antecedent(np.linspace(0, 100, 200), 'economic_indicators')
-        self.portfolio_diversification = ctrl.Antecedent(np.linspace(0, 100, 200), 'portfolio_diversification')
-        self.financial_goals = ctrl.Antecedent(np.linspace(0, 100, 200), 'financial_goals')
-
-        # Output variable
-        self.portfolio_adjustment = ctrl.Consequent(np.linspace(0, 100, 200), 'portfolio_adjustment')
-
-        # Initialize fuzzy sets and rules
-        self._setup_fuzzy_sets()
-        self._define_sugeno_rules()
-
-        # Create control system
-        self.control_system = ctrl.ControlSystem(self.rules)
-        self.simulator = ctrl.ControlSystemSimulation(self.control_system)
-
-    def _setup_fuzzy_sets(self):
-        # Risk Tolerance
-        self.risk_tolerance['low'] = fuzz.trapmf(self.risk_tolerance.universe, [0, 0, 20, 40])
-        self.risk_tolerance['medium'] = fuzz.trapmf(self.risk_tolerance.universe, [30, 40, 60, 70])
-        self.risk_tolerance['high'] = fuzz.trapmf(self.risk_tolerance.universe, [60, 70, 100, 100])
-
-        # Market Conditions
-        self.market_conditions['bearish'] = fuzz.trapmf(self.market_conditions.universe, [0, 0, 20, 40])
-        self.market_conditions['neutral'] = fuzz.trapmf(self.market_conditions.universe, [30, 40, 60, 70])
-        self.market_conditions['bullish'] = fuzz.trapmf(self.market_conditions.universe, [60, 70, 100, 100])
-
-        # Economic Indicators
-        self.economic_indicators['negative'] = fuzz.trapmf(self.economic_indicators.universe, [0, 0, 20, 40])
-        self.economic_indicators['positive'] = fuzz.trapmf(self.economic_indicators.universe, [60, 70, 100, 100])
-
-        # Portfolio Diversification
-        self.portfolio_diversification['poor'] = fuzz.trapmf(self.portfolio_diversification.universe, [0, 0, 20, 40])
-        self.portfolio_diversification['moderate'] = fuzz.trapmf(self.portfolio_diversification.universe,
-                                                                 [30, 40, 60, 70])
-        self.portfolio_diversification['good'] = fuzz.trapmf(self.portfolio_diversification.universe,
-                                                             [60, 70, 100, 100])
-
-        # Financial Goals
-        self.financial_goals['short_term'] = fuzz.trapmf(self.financial_goals.universe, [0, 0, 20, 40])
-        self.financial_goals['balanced'] = fuzz.trapmf(self.financial_goals.universe, [30, 40, 60, 70])
-        self.financial_goals['long_term'] = fuzz.trapmf(self.financial_goals.universe, [60, 70, 100, 100])
-
-        # Sugeno output
-        universe = np.linspace(0, 100, 200)
-
-        # 创建输出变量的模糊集
-        self.portfolio_adjustment['diversify'] = fuzz.trimf(universe, [0, 0, 30])
-        self.portfolio_adjustment['rebalance'] = fuzz.trimf(universe, [30, 50, 70])
-        self.portfolio_adjustment['hold'] = fuzz.trimf(universe, [70, 100, 100])
-
-    def _define_sugeno_rules(self):
-        self.rules = [
-            # Rule 1: Low risk, bearish market, poor diversification
-            ctrl.Rule(
-                self.risk_tolerance['low'] &
-                self.market_conditions['bearish'] &
-                self.portfolio_diversification['poor'],
-                self.portfolio_adjustment['diversify']
-            ),
-
-            # Rule 2: Medium risk, negative economic indicators, long-term goals
-            ctrl.Rule(
-                self.risk_tolerance['medium'] &
-                self.economic_indicators['negative'] &
-                self.financial_goals['long_term'],
-                self.portfolio_adjustment['rebalance']
-            ),
-
-            # Rule 3: Bullish market, moderate diversification, balanced goals
-            ctrl.Rule(
-                self.market_conditions['bullish'] &
-                self.portfolio_diversification['moderate'] &
-                self.financial_goals['balanced'],
-                self.portfolio_adjustment['diversify']
-            ),
-
-            # Rule 4: High risk, positive economic indicators, short-term goals
-            ctrl.Rule(
-                self.risk_tolerance['high'] &
-                self.economic_indicators['positive'] &
-                self.financial_goals['short_term'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 5: Negative economic indicators or poor diversification, long-term goals
-            ctrl.Rule(
-                (self.economic_indicators['negative'] |
-                 self.portfolio_diversification['poor']) &
-                self.financial_goals['long_term'],
-                self.portfolio_adjustment['rebalance']
-            ),
-
-            # Rule 6: Low risk, neutral market, balanced goals
-            ctrl.Rule(
-                self.risk_tolerance['low'] &
-                self.market_conditions['neutral'] &
-                self.financial_goals['balanced'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 7: High risk or good diversification, positive economic indicators
-            ctrl.Rule(
-                (self.risk_tolerance['high'] |
-                 self.portfolio_diversification['good']) &
-                self.economic_indicators['positive'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 8: Bearish market, negative economic indicators, short-term goals
-            ctrl.Rule(
-                self.market_conditions['bearish'] &
-                self.economic_indicators['negative'] &
-                self.financial_goals['short_term'],
-                self.portfolio_adjustment['rebalance']
-            ),
-
-            # Rule 9: Neutral market or positive economic indicators, medium risk
-            ctrl.Rule(
-                (self.market_conditions['neutral'] |
-                 self.economic_indicators['positive']) &
-                self.risk_tolerance['medium'],
-                self.portfolio_adjustment['hold']
-            ),
-
-            # Rule 10: Low risk, negative economic indicators, poor diversification
-            ctrl.Rule(
-                self.risk_tolerance['low'] &
-                self.economic_indicators['negative'] &
-                self.portfolio_diversification['poor'],
-                self.portfolio_adjustment['diversify']
-            )
-        ]
+    def __init__(self, engine='skfuzzy', defuzzify='sampled', inference='mamdani', simulation_cache='flush',
+                 simulation_cache_size=1000, spec='sugeno_validate'):
+        """
+        engine: 'skfuzzy' runs compute_portfolio_adjustment through the skfuzzy
+        simulator, 'compiled' through the CompiledRuleBase arrays
+        defuzzify: 'sampled' is skfuzzy's centroid over the 200-point universe,
+        'analytic' the exact centroid of the trimf/trapmf output terms
+        (needs engine='compiled'; the skfuzzy engine rejects it)
+        inference: 'mamdani' uses the trimf output sets of the spec, 'zero_order' and
+        'first_order' the Takagi-Sugeno consequents in tsk_coefficients, which
+        skip aggregation and defuzzification and always run compiled
+        simulation_cache: how the skfuzzy simulator caches per-input state,
+        'off', 'lru' (the last simulation_cache_size distinct inputs) or
+        'flush' (skfuzzy's default, cleared every simulation_cache_size runs)
+        spec: FuzzySpec, spec document, .json path or name of a spec in specs/
+        with the five portfolio inputs and the portfolio_adjustment output
+        """
+        if engine not in ('skfuzzy', 'compiled'):
+            raise ValueError(f"Unknown engine: {engine}")
+        if defuzzify not in ('sampled', 'analytic'):
+            raise ValueError(f"Unknown defuzzification: {defuzzify}")
+        if simulation_cache not in SIMULATION_CACHE_MODES:
+            raise ValueError(f"Unknown simulation cache mode: {simulation_cache}")
+        if inference not in ('mamdani', 'zero_order', 'first_order'):
+            raise ValueError(f"Unknown inference: {inference}")
+        if engine == 'skfuzzy' and defuzzify == 'analytic':
+            raise ValueError("Analytic defuzzification needs engine='compiled'")
+        if inference != 'mamdani' and defuzzify != 'sampled':
+            raise ValueError("Takagi-Sugeno inference has no defuzzification step")
+        self.engine = engine
+        self.defuzzify = defuzzify
+        self.inference = inference
+        self.fuzzifier = None
+        self.result_cache = None
+
+        # Variables, terms and rules come from the declarative spec
+        self.spec = load_spec(spec)
+        if self.spec.input_labels != list(INPUT_COLUMNS) or self.spec.output_label != 'portfolio_adjustment':
+            raise ValueError(f"Spec {self.spec.name!r} does not describe the portfolio adjustment variables")
+        antecedents, self.portfolio_adjustment, self.rules, self.control_system = self.spec.build_control_system()
+        (self.risk_tolerance, self.market_conditions, self.economic_indicators,
+         self.portfolio_diversification, self.financial_goals) = antecedents
+        self.adjustment_shapes = self.spec.output_shapes()
+        if self.adjustment_shapes is None or any(len(params) != 3 for params in self.adjustment_shapes.values()):
+            raise ValueError("Sugeno consequents start from trimf output terms")
+
+        self.simulator = build_simulation(self.control_system, simulation_cache, simulation_cache_size)
+        self.compiled_rule_base = CompiledRuleBase(
+            [self.risk_tolerance, self.market_conditions, self.economic_indicators,
+             self.portfolio_diversification, self.financial_goals],
+            self.portfolio_adjustment, self.rules, output_shapes=self.adjustment_shapes)
+
+        # Takagi-Sugeno consequents, one row per rule: a constant followed by a
+        # slope per input. They start as the centroid of each rule's trimf output
+        # set with zero slopes; fit_first_order_consequents() fits the slopes.
+        centroids = [sum(self.adjustment_shapes[label]) / 3 for label in self.compiled_rule_base.output_terms]
+        self.tsk_coefficients = np.zeros((len(self.compiled_rule_base.rule_weights), 6))
+        self.tsk_coefficients[:, 0] = np.take(centroids, self.compiled_rule_base.consequent_terms)
 
     def compute_portfolio_adjustment(self, risk_tolerance, market_condition,
                                      economic_indicator, portfolio_div, financial_goal):
+        values = (risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal)
+        if self.result_cache is not None:
+            return self.result_cache.get_or_compute(self.fingerprint, values, self._compute_portfolio_adjustment)
+        return self._compute_portfolio_adjustment(*values)
+
+    def _compute_portfolio_adjustment(self, risk_tolerance, market_condition,
+                                      economic_indicator, portfolio_div, financial_goal):
+        if self.inference != 'mamdani':
+            score = self.compute_portfolio_adjustment_batch(risk_tolerance, market_condition, economic_indicator,
+                                                            portfolio_div, financial_goal)[0]
+            if np.isnan(score):
+                # Same failure as the skfuzzy simulator when no rule fires
+                raise KeyError('portfolio_adjustment')
+            return float(score)
+
+        if self.engine == 'compiled':
+            score = self.compiled_rule_base.compute_one(risk_tolerance, market_condition, economic_indicator,
+                                                        portfolio_div, financial_goal,
+                                                        defuzzify=self.defuzzify)
+            if np.isnan(score):
+                # Same failure as the skfuzzy simulator when no rule fires
+                raise KeyError('portfolio_adjustment')
+            return score
+
         # Ensure input variable names match the system definition
         self.simulator.input['risk_tolerance'] = risk_tolerance
         self.simulator.input['market_conditions'] = market_condition
@@ -156,13 +105,97 @@ class PortfolioAdjustmentFuzzySugeno:
         self.simulator.input['portfolio_diversification'] = portfolio_div
         self.simulator.input['financial_goals'] = financial_goal
 
-        # Compute results
+        # Compute results; a cached run only copies outputs that exist, so drop
+        # the last score or inputs where no rule fires would return it
+        self.simulator.output.clear()
         self.simulator.compute()
 
         # Return output
         return self.simulator.output['portfolio_adjustment']
 
+    def simulation_footprint(self):
+        """Per-input state held by the skfuzzy simulator, see SimulationCache.simulation_footprint"""
+        return simulation_footprint(self.simulator)
+
+    def attach_result_cache(self, cache):
+        """
+        Memoize compute_portfolio_adjustment in a ResultCache under this model's
+        fingerprint. Attach again after editing terms or rules by hand. Pass
+        None to detach.
+        """
+        self.result_cache = cache
+        self.fingerprint = model_fingerprint(self) if cache is not None else None
+
+    def compute_portfolio_adjustment_batch(self, risk_tolerance, market_condition,
+                                           economic_indicator, portfolio_div, financial_goal,
+                                           chunk_size=8192):
+        """
+        Vectorized compute_portfolio_adjustment for equal-length input arrays.
+
+        Scores agree with compute_portfolio_adjustment to within BATCH_TOLERANCE
+        (or are exact centroids with defuzzify='analytic'); rows where no rule
+        fires or an input is NaN come back as NaN.
+        """
+        inputs = [risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal]
+        if self.inference != 'mamdani':
+            return self.compiled_rule_base.takagi_sugeno(inputs, self._active_tsk_coefficients(),
+                                                         chunk_size=chunk_size, fuzzifier=self.fuzzifier)
+        return self.compiled_rule_base.compute(inputs, chunk_size=chunk_size, defuzzify=self.defuzzify,
+                                               fuzzifier=self.fuzzifier)
+
+    def _active_tsk_coefficients(self):
+        if self.inference == 'zero_order':
+            coefficients = np.zeros_like(self.tsk_coefficients)
+            coefficients[:, 0] = self.tsk_coefficients[:, 0]
+            return coefficients
+        return self.tsk_coefficients
+
+    def fit_first_order_consequents(self, risk_tolerance, market_condition, economic_indicator,
+                                    portfolio_div, financial_goal, targets):
+        """
+        Least-squares fit of the first-order consequents to target scores
+        (for example the Mamdani output for the same inputs). The output is
+        linear in the coefficients once the normalized firing strengths are
+        known, so one lstsq solve is enough. Returns the RMS error of the fit.
+
+        On 20000 uniform random clients the zero-order consequents are about
+        2.6 RMS from this model's own Mamdani output and about 6.3 from
+        MamdaniValidate; first-order fits to those targets reach about 2.0
+        and 1.3 respectively.
+        """
+        inputs = [risk_tolerance, market_condition, economic_indicator, portfolio_div, financial_goal]
+        weights, fired = self.compiled_rule_base.normalized_strengths(inputs)
+        targets = np.asarray(targets, dtype=float).ravel()
+        fired &= ~np.isnan(targets)
+
+        regressors = np.column_stack([np.ones(len(weights)),
+                                      self.compiled_rule_base.clipped_inputs(
+                                          [np.asarray(values, dtype=float).ravel() for values in inputs])])
+        design = (weights[fired, :, None] * regressors[fired, None, :]).reshape(fired.sum(), -1)
+        solution = np.linalg.lstsq(design, targets[fired], rcond=None)[0]
+        self.tsk_coefficients = solution.reshape(self.tsk_coefficients.shape)
+        self.attach_result_cache(self.result_cache)
+        return float(np.sqrt(np.mean((design @ solution - targets[fired]) ** 2)))
+
+    def attach_fuzzifier(self, fuzzifier, tolerance):
+        """
+        Fuzzify batches with a LookupFuzzifier built for compiled_rule_base,
+        provided its memberships differ from compiled_rule_base.fuzzify by at
+        most tolerance (its engine_error). Single scores keep the exact
+        memberships. Pass None to detach.
+        """
+        if fuzzifier is not None:
+            if not fuzzifier.built_for(self.compiled_rule_base):
+                raise ValueError("The fuzzifier was built for a different rule base")
+            if not fuzzifier.engine_error <= tolerance:
+                raise ValueError(f"Fuzzifier memberships differ from the engine's by {fuzzifier.engine_error}, "
+                                 f"more than tolerance {tolerance}")
+        self.fuzzifier = fuzzifier
+        self.attach_result_cache(self.result_cache)
+
     def visualize_final_decision(self, adjustment_score, recommendation):
+        import matplotlib.pyplot as plt
+
         x = np.linspace(0, 100, 200)
 
         # 第一个窗口：三角形隶属度
@@ -308,6 +341,8 @@ def get_float_input(prompt, min_val=None, max_val=None):
 
 
 def main():
+    import matplotlib.pyplot as plt
+
     print("********* Sugeno Portfolio Adjustment Model *********")
 
     fuzzy_system = PortfolioAdjustmentFuzzySugeno()
@@ -503,9 +538,9 @@ def main():
 
             plt.figure(figsize=(10, 6))
             goal_universe = np.linspace(0, 120, 200)
-            short_term_values = [financial_goal_system.short_term_membership(x) for x in goal_universe]
-            balanced_values = [financial_goal_system.balanced_membership(x) for x in goal_universe]
-            long_term_values = [financial_goal_system.long_term_membership(x) for x in goal_universe]
+            short_term_values = financial_goal_system.short_term_membership(goal_universe)
+            balanced_values = financial_goal_system.balanced_membership(goal_universe)
+            long_term_values = financial_goal_system.long_term_membership(goal_universe)
 
             plt.plot(goal_universe, short_term_values, label='Short-term', color='blue')
             plt.plot(goal_universe, balanced_values, label='Balanced', color='green')